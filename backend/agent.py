@@ -4,38 +4,75 @@ import re
 import time
 from typing import Optional
 
+from checkin_flow import CheckInState
 from config import config
+from conversation_history import ConversationHistory
 from dialogue_manager import DialogueManager
 from generate_reply import generate_reply
-from persistent_memory import PersistentMemory
-from reminder_loop import ReminderLoop
+from memory_index import MemoryIndex, format_memories
+from persistent_memory import PersistentMemory, create_memory_store
 from reminder_scheduler import ReminderScheduler
 from sentiment_analyzer import analyze_tone
+from user_memory import shard_path
 
 # Initialize logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class Agent:
-    def __init__(self):
-        self.conversation_memory = []
-        self.memory_store: PersistentMemory = PersistentMemory()
-        self.scheduler = ReminderScheduler(memory=self.memory_store)
-        self.dialogue_manager = DialogueManager(memory_store=self.memory_store, scheduler=self.scheduler)
+    def __init__(self, user_id: Optional[str] = None):
+        # With a user_id everything this agent remembers lives in that user's own shard
+        self.user_id = user_id
+        self.memory_store: PersistentMemory = create_memory_store(user_id=user_id)
+        log_dir = shard_path(user_id, base_dir=config.CONVERSATION_LOG_DIR, extension="") if user_id \
+            else config.CONVERSATION_LOG_DIR
+        self.history = ConversationHistory(
+            capacity=config.MEMORY_THRESHOLD,
+            log_dir=log_dir,
+            segment_bytes=config.CONVERSATION_SEGMENT_BYTES,
+        )
+        self.memory_index: Optional[MemoryIndex] = None
+        if config.LONG_TERM_MEMORY:
+            index_dir = shard_path(user_id, base_dir=config.MEMORY_INDEX_DIR, extension="") if user_id \
+                else config.MEMORY_INDEX_DIR
+            self.memory_index = MemoryIndex(index_dir)
+        self.scheduler = ReminderScheduler(memory=self.memory_store, notify_callback=self._handle_reminder_notification)
+        self.dialogue_manager = DialogueManager(
+            memory_store=self.memory_store, scheduler=self.scheduler, memory_index=self.memory_index
+        )
         self.user_name: Optional[str] = self.memory_store.get("user_name")
         self.pending_name_change = None
+        self.checkin_state = CheckInState()  # this user's guided check-in, driven by /chat and /checkin
         self.traits = {
             "name": config.AGENT_NAME,
             "personality": config.AGENT_PERSONALITY,
             "memory_threshold": config.MEMORY_THRESHOLD,
         }
 
-        self.reminder_loop = ReminderLoop(self.memory_store, self._handle_reminder_notification)
-        self.reminder_loop.start()
+        self.scheduler.start()
 
         logger.info(f"Agent '{self.traits['name']}' initialized with personality: {self.traits['personality']}")
 
+    @property
+    def conversation_memory(self) -> list:
+        """Texts in the hot conversation window (user inputs and reminders), oldest first."""
+        return [entry["text"] for entry in self.history.recent()]
+
     def process_statement(self, user_input: str) -> str:
+        response = self._respond(user_input)
+        # Replies go to the on-disk log only, so the hot window keeps its old meaning
+        self.history.append({"role": "ren", "text": response}, hot=False)
+        if self.memory_index is not None and len(user_input.strip()) >= 3:
+            self.memory_index.add(f"User: {user_input.strip()}\nRen: {response}")
+        return response
+
+    def _recall(self, query: str) -> str:
+        """Long-term memories relevant to `query`, formatted for the prompt."""
+        if self.memory_index is None:
+            return ""
+        return format_memories(self.memory_index.search(query))
+
+    def _respond(self, user_input: str) -> str:
         if not user_input or not isinstance(user_input, str) or not user_input.strip():
             raise ValueError("User input must be a non-empty string")
         if self._is_correction_triggered(user_input):
@@ -44,7 +81,9 @@ class Agent:
         user_input = user_input.strip()
         logger.info(f"Processing user input: {user_input[:100]}...")
 
-        tone_data = analyze_tone(user_input)
+        # Answers to Ren's own questions (name confirmation, reminder slots) are usually formulaic
+        expecting_reply = self.pending_name_change is not None or self.dialogue_manager.awaiting_reply()
+        tone_data = analyze_tone(user_input, expecting_reply=expecting_reply)
         sentiment = tone_data["tone"]
         confidence = tone_data.get("confidence", 0.0)
         logger.info(f"Sentiment analysis result: {tone_data}")
@@ -81,9 +120,7 @@ class Agent:
         self._maybe_remember_name(user_input)
 
         try:
-            self.conversation_memory.append(user_input)
-            if len(self.conversation_memory) > self.traits["memory_threshold"]:
-                self.conversation_memory.pop(0)
+            self.history.append({"role": "user", "text": user_input})
 
             dialogue_response = self.dialogue_manager.handle_input(user_input, self.user_name)
             if dialogue_response is not None:
@@ -132,7 +169,7 @@ class Agent:
         try:
             retry_reply = generate_reply(
                 user_input=retry_prompt,
-                memory="",
+                memory=self._recall(original_input),
                 tone_data=tone_data,
                 user_name=self.user_name,  
             )
@@ -249,15 +286,21 @@ class Agent:
             "Let’s just sit with this for a moment, if that’s okay."
         ])
 
+    def shutdown(self):
+        """Stop background work and write out memory before this agent is dropped."""
+        self.scheduler.stop()
+        self.memory_store.flush()
+        self.memory_store.close()
+
     def _handle_reminder_notification(self, message: str):
         logger.info(f"[ReminderLoop] {message}")
-        self.conversation_memory.append(message)
+        self.history.append({"role": "reminder", "text": message})
 
     def get_conversation_summary(self) -> dict:
         return {
-            "memory_count": len(self.conversation_memory),
+            "memory_count": len(self.history),
             "memory_threshold": self.traits["memory_threshold"],
-            "recent_inputs": self.conversation_memory[-3:] if self.conversation_memory else [],
+            "recent_inputs": [entry["text"] for entry in self.history.recent(3)],
             "agent_name": self.traits["name"],
             "personality": self.traits["personality"],
             "user_name": self.user_name or "unknown"
@@ -1,30 +1,50 @@
 from ast import Bytes
+from functools import partial
 from io import BytesIO
+import json
 import logging
 import os
 import signal
 import sys
+from typing import Optional
+from urllib.parse import quote
 
-from flask import Flask, jsonify, request
+from flask import Flask, Request, g, jsonify, request
 from flask import Response
 from flask_cors import CORS
+from flask_sock import Sock
+from simple_websocket import ConnectionClosed
 from torch.utils import data
 
 from agent import Agent
+from audio_decode import SAMPLE_RATE, AudioTooLarge, decode_audio
+from audio_stream import WindowedTranscriber
 from checkin_flow import CheckInState, handle_checkin_input
 from config import config
 from intent_router import route_intent
-from voice import transcribe_audio_file
-from voice import listen_to_voice, speak
+from model_loader import ModelNotReady, models
+from reminder_scheduler import is_reminder_id
+from sentiment_analyzer import batcher as sentiment_batcher, current_backend as sentiment_backend, tier_stats, tone_cache
+from user_memory import ResidentUsers
+from voice import transcribe_upload
+from voice import endpoint_latency_stats, listen_to_voice, synthesize, synthesize_stream, transcription_pool_stats, tts_cache
 
 # Initialize logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+class InMemoryRequest(Request):
+    """Keeps multipart file uploads in memory instead of spooling large ones to temp files."""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return BytesIO()
+
 app = Flask(__name__)
+app.request_class = InMemoryRequest
 CORS(app)  # Enable CORS for all routes
+sock = Sock(app)
 
-checkin_state: CheckInState = CheckInState()
+MULTIPART_OVERHEAD = 64 * 1024  # room for boundaries and form fields around the audio
 
 # Initialize agent
 try:
@@ -35,6 +55,31 @@ except Exception as e:
     ren_agent = None
    
 
+# Per-user agents, each with its own memory shard; only recently active users stay resident
+user_agents: ResidentUsers[Agent] = ResidentUsers(
+    factory=lambda user_id: Agent(user_id=user_id),
+    on_evict=lambda agent: agent.shutdown(),
+)
+
+def agent_for_request(data: Optional[dict] = None) -> Optional[Agent]:
+    """
+    Return the agent for the request's user (`user_id` field or X-User-Id header), else the default agent.
+    The user's agent is leased until the response has been sent, so an eviction meanwhile can't shut it down.
+    """
+    user_id = (data or {}).get("user_id") or request.headers.get("X-User-Id")
+    if ren_agent is None or not user_id:
+        return ren_agent
+    agent = user_agents.acquire(str(user_id))
+    g.setdefault("leased_users", []).append(str(user_id))
+    return agent
+
+@app.after_request
+def release_leased_agents(response: Response) -> Response:
+    # call_on_close runs once the body is sent, so streamed responses keep their agent to the end
+    for user_id in g.pop("leased_users", []):
+        response.call_on_close(partial(user_agents.release, user_id))
+    return response
+
 # Start the reminder scheduler
 if ren_agent and ren_agent.scheduler:
     ren_agent.scheduler.start()
@@ -45,6 +90,9 @@ def shutdown_handler(signum, frame):
     if ren_agent and ren_agent.scheduler:
         ren_agent.scheduler.stop()
         logger.info("Reminder scheduler stopped")
+    if ren_agent:
+        ren_agent.memory_store.flush()  # write out any coalesced memory updates
+    user_agents.close()
     logger.info("Exiting application")
     sys.exit(0)
 
@@ -52,14 +100,6 @@ def shutdown_handler(signum, frame):
 signal.signal(signal.SIGINT, shutdown_handler)   # Ctrl+C
 signal.signal(signal.SIGTERM, shutdown_handler)  # Termination signal
 
-# Optionally, also stop scheduler on Flask app context teardown
-@app.teardown_appcontext
-def teardown(exception):
-    logger.info("App context teardown, stopping scheduler...")
-    if ren_agent and ren_agent.scheduler:
-        ren_agent.scheduler.stop()
-        logger.info("Reminder scheduler stopped")
-
 @app.route("/chat", methods=["POST"])
 def handle_text():
     try:
@@ -73,6 +113,7 @@ def handle_text():
         user_input = data.get("message", "")
         if not isinstance(user_input, str) or not user_input.strip():
             return jsonify({"error": "Message must be a non-empty string"}), 400
+        agent = agent_for_request(data)
 
         # ── Intent routing ───────────────────────────────
         intent = route_intent(user_input)
@@ -84,24 +125,23 @@ def handle_text():
 
         # structured check-in flow
         if intent.name == "checkin":
-            global checkin_state
             # If inactive, kick it off; else advance with input
-            if not checkin_state.active:
-                checkin_state = CheckInState(active=True, phase="intro")
+            if not agent.checkin_state.active:
+                agent.checkin_state = CheckInState(active=True, phase="intro")
                 reply = "Let’s do a quick check-in. How are you feeling right now?"
-                return jsonify({"response": reply, "phase": checkin_state.phase, "checkin": True}), 200
-            new_state, reply, done = handle_checkin_input(checkin_state, user_input)
-            checkin_state = new_state
+                return jsonify({"response": reply, "phase": agent.checkin_state.phase, "checkin": True}), 200
+            new_state, reply, done = handle_checkin_input(agent.checkin_state, user_input)
+            agent.checkin_state = new_state
             if done:
                 # optional: persist summary in agent memory
                 try:
-                    ren_agent.memory_store.set("last_checkin_summary", checkin_state.summary or "")
+                    agent.memory_store.set("last_checkin_summary", agent.checkin_state.summary or "")
                 except Exception:
                     pass
-                checkin_state = CheckInState()  # reset
+                agent.checkin_state = CheckInState()  # reset
             return jsonify({
                 "response": reply,
-                "phase": checkin_state.phase,
+                "phase": agent.checkin_state.phase,
                 "done": done,
                 "checkin": True
             }), 200
@@ -120,13 +160,15 @@ def handle_text():
         # ────────────────────────────────────────────────
 
         # default: send to your LLM agent
-        response = ren_agent.process_statement(user_input)
+        response = agent.process_statement(user_input)
         return jsonify({
             "response": response,
-            "conversation_summary": ren_agent.get_conversation_summary(),
+            "conversation_summary": agent.get_conversation_summary(),
             "intent": intent.name
         }), 200
 
+    except ModelNotReady as e:
+        return model_not_ready(e)
     except ValueError as e:
         logger.warning(f"Validation error in text handler: {e}")
         return jsonify({"error": str(e)}), 400
@@ -146,24 +188,44 @@ def handle_voice():
                 "error": "Voice functionality not configured. Please set ELEVENLABS_API_KEY and ELEVEN_VOICE_ID environment variables."
             }), 503
 
+        agent = agent_for_request(request.get_json(silent=True))
         logger.info("Processing voice request...")
 
         try:
             user_input = listen_to_voice()
+        except ModelNotReady:
+            raise
         except RuntimeError as e:
             logger.error(f"Voice listening failed: {e}")
             return jsonify({"error": f"Voice listening failed: {str(e)}"}), 400
 
         try:
-            response = ren_agent.process_statement(user_input)
-            last_sentiment = ren_agent.memory_store.get("last_sentiment", {})
+            response = agent.process_statement(user_input)
+            last_sentiment = agent.memory_store.get("last_sentiment", {})
             tone = last_sentiment.get("sentiment", "calm")  # default to "calm"
         except ValueError as e:
             logger.warning(f"Invalid voice input: {e}")
             return jsonify({"error": f"Invalid input: {str(e)}"}), 400
 
+        # Clients that ask for audio (Accept: audio/mpeg) get the spoken reply streamed back,
+        # with the text in URL-encoded headers
+        if request.accept_mimetypes.best == "audio/mpeg":
+            try:
+                audio, cached = synthesize_stream(response, tone=tone)
+            except RuntimeError as e:
+                logger.error(f"Speech synthesis failed: {e}")
+                return jsonify({"heard": user_input, "response": response, "tone": tone,
+                                "speech_status": f"failed: {str(e)}"}), 502
+            return Response(audio, content_type="audio/mpeg", headers={
+                "X-Ren-Heard": quote(user_input),
+                "X-Ren-Response": quote(response),
+                "X-Ren-Tone": tone,
+                "X-TTS-Cache": "hit" if cached else "miss",
+            })
+
+        speech_cached = False
         try:
-            speak(response, tone=tone)  # 🎤 pass tone into TTS
+            _, speech_cached = synthesize(response, tone=tone)  # 🎤 pass tone into TTS
             speech_status = "success"
         except RuntimeError as e:
             logger.error(f"Speech synthesis failed: {e}")
@@ -174,16 +236,19 @@ def handle_voice():
             "response": response,
             "tone": tone,
             "speech_status": speech_status,
-            "conversation_summary": ren_agent.get_conversation_summary()
+            "speech_cached": speech_cached,
+            "conversation_summary": agent.get_conversation_summary()
         })
 
+    except ModelNotReady as e:
+        return model_not_ready(e)
     except Exception as e:
         logger.error(f"Unexpected error in voice handler: {e}")
         return jsonify({"error": "Internal server error"}), 500
     
 @app.route("/tts", methods=["POST"])
 def generate_speech():
-    """Convert text to speech return MP3."""
+    """Convert text to speech and return MP3, streamed unless `"stream": false`."""
     if ren_agent is None:
         return jsonify({"error": "Agent not initialized"}), 503
     if not request.is_json:
@@ -196,8 +261,12 @@ def generate_speech():
         return jsonify({"error": "Invalid text input"}), 400
     
     try:
-        audio = speak(text)
-        return Response(audio, content_type="audio/mpeg")
+        # Streaming relays MP3 chunks as ElevenLabs produces them, so playback starts before synthesis ends
+        if data.get("stream", config.TTS_STREAM):
+            audio, cached = synthesize_stream(text)
+        else:
+            audio, cached = synthesize(text)
+        return Response(audio, content_type="audio/mpeg", headers={"X-TTS-Cache": "hit" if cached else "miss"})
     except Exception as e:
         logger.error(f"Error generating speech: {e}")
         return jsonify({"error": "Internal server error"}), 500
@@ -207,19 +276,195 @@ def transcribe_uploaded_audio():
     """Accepts uploaded audio and returns Whisper transcription."""
     if ren_agent is None:
         return jsonify({"error": "Agent not initialized"}), 503
-    if "file" not in request.files:
+
+    # Multipart uploads are parsed into memory (see InMemoryRequest), so bound them up front;
+    # a raw audio body is streamed and cut off by transcribe_upload instead
+    if request.mimetype == "multipart/form-data":
+        if request.content_length is None:
+            return jsonify({"error": "Content-Length is required for multipart uploads"}), 411
+        if request.content_length > config.TRANSCRIBE_MAX_BYTES + MULTIPART_OVERHEAD:
+            return jsonify({"error": f"Audio upload exceeds {config.TRANSCRIBE_MAX_BYTES} bytes"}), 413
+        if "file" not in request.files:
+            return jsonify({"error": "Missing audio file"}), 400
+        stream, content_type = request.files["file"].stream, request.files["file"].mimetype
+    elif request.content_length == 0:
         return jsonify({"error": "Missing audio file"}), 400
-    
+    else:
+        stream, content_type = request.stream, request.content_type
+
     try:
-        file = request.files["file"]
-        stream = BytesIO(file.read())
-        text = transcribe_audio_file(stream)
-        return jsonify({"text": text})
+        result = transcribe_upload(stream, content_type=content_type)
+        return jsonify({key: result[key] for key in ("text", "segments", "chunks") if key in result})
+    except ModelNotReady as e:
+        return model_not_ready(e)
+    except AudioTooLarge as e:
+        return jsonify({"error": str(e)}), 413
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         logger.error(f"Audio transcription failed: {e}")
         return jsonify({"error": str(e)}), 500
 
 
+@sock.route("/stream")
+def stream_speech(ws):
+    """
+    Streaming speech-to-text over a WebSocket.
+
+    The client sends binary frames of raw 16-bit little-endian PCM (16 kHz mono
+    unless `?rate=` / `?channels=` say otherwise) and a text frame "end" when it
+    stops talking. The server answers with JSON messages:
+    {"type": "partial", "text": new words} every STREAM_STEP_SECONDS of audio,
+    then {"type": "final", "text": whole transcript}. With `?respond=true` each
+    partial also goes to the user's DialogueManager.handle_partial_transcription
+    and the answer comes back as {"type": "reply", "text": ...}.
+    """
+    def send(kind, **fields):
+        ws.send(json.dumps({"type": kind, **fields}))
+
+    def emit(new_text):
+        if not new_text:
+            return
+        send("partial", text=new_text)
+        if agent is not None:
+            reply = agent.dialogue_manager.handle_partial_transcription(new_text, agent.user_name)
+            if reply:
+                send("reply", text=reply)
+
+    rate = request.args.get("rate", SAMPLE_RATE, type=int)
+    channels = request.args.get("channels", 1, type=int)
+    if rate <= 0 or channels <= 0:
+        return send("error", error="'rate' and 'channels' must be positive")
+    agent = None
+    if request.args.get("respond", "false").lower() == "true":
+        agent = agent_for_request({"user_id": request.args.get("user_id")})
+        if agent is None:
+            return send("error", error="Agent not initialized")
+
+    # The socket's response never reaches the WSGI server's close(), so hand the agent back here;
+    # the model is leased for the session so the idle sweeper can't unload it mid-stream
+    whisper_leased = False
+    try:
+        transcriber = WindowedTranscriber(models.acquire("whisper"))
+        whisper_leased = True
+
+        # Keep whole samples (and whole decimation groups) together across frames
+        content_type = f"audio/pcm; rate={rate}; channels={channels}"
+        align = 2 * channels * (rate // SAMPLE_RATE if rate % SAMPLE_RATE == 0 else 1)
+        pending = b""
+        while True:
+            message = ws.receive()
+            if isinstance(message, str):
+                if message.strip().lower() == "end":
+                    break
+                continue
+            pending += message
+            usable = len(pending) - len(pending) % align
+            if not usable:
+                continue
+            transcriber.write(decode_audio(pending[:usable], content_type=content_type))
+            pending = pending[usable:]
+            if transcriber.ring.total_written > config.TRANSCRIBE_MAX_SECONDS * SAMPLE_RATE:
+                send("error", error=f"Stream exceeds {config.TRANSCRIBE_MAX_SECONDS:g}s")
+                break
+            if transcriber.ready():
+                emit(transcriber.decode())
+        emit(transcriber.flush())
+        send("final", text=transcriber.transcript)
+    except ModelNotReady as e:
+        send("error", error=str(e), state=e.state, retry_after=e.retry_after)
+    except ValueError as e:
+        send("error", error=str(e))
+    except ConnectionClosed:
+        raise  # the client went away; flask-sock handles it
+    except Exception as e:
+        # A crashed or closed worker, a transcription timeout, a failed reply: tell the client before the socket drops
+        logger.error(f"Streaming transcription failed: {e}")
+        send("error", error="Streaming transcription failed")
+    finally:
+        if whisper_leased:
+            models.release("whisper")
+        for user_id in g.pop("leased_users", []):
+            user_agents.release(user_id)
+
+@app.route("/reminders/batch", methods=["POST"])
+def batch_reminders():
+    """Create, update and delete many reminders with a single memory write."""
+    if ren_agent is None:
+        return jsonify({"error": "Agent not initialized"}), 503
+    if not request.is_json:
+        return jsonify({"error": "Request must be JSON"}), 400
+
+    data = request.get_json() or {}
+    create = data.get("create", [])
+    update = data.get("update", [])
+    delete = data.get("delete", [])
+    if not isinstance(create, list) or not isinstance(update, list) or not isinstance(delete, list):
+        return jsonify({"error": "'create', 'update' and 'delete' must be lists"}), 400
+    # Ids key a dict below, so an unhashable one (a list, an object) must be turned away here
+    for index, item in enumerate(update):
+        if not isinstance(item, dict) or not is_reminder_id(item.get("id")):
+            return jsonify({"error": f"Update #{index} needs an 'id' that is a string or integer"}), 400
+    for index, rid in enumerate(delete):
+        if not is_reminder_id(rid):
+            return jsonify({"error": f"Delete #{index} must be a string or integer id"}), 400
+
+    try:
+        result = agent_for_request(data).scheduler.apply_batch(
+            create=create,
+            update={str(item["id"]): item for item in update},
+            delete=[str(rid) for rid in delete],
+        )
+        return jsonify(result), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+@app.route("/reminders/import", methods=["POST"])
+def import_reminders():
+    """Import reminders from a JSON array or a JSONL body in one write."""
+    if ren_agent is None:
+        return jsonify({"error": "Agent not initialized"}), 503
+
+    try:
+        body = request.get_data(as_text=True).strip()
+        if body.startswith("["):
+            items = json.loads(body)
+        else:
+            items = [json.loads(line) for line in body.splitlines() if line.strip()]
+        result = agent_for_request().scheduler.apply_batch(create=items)
+        return jsonify({"imported": len(result["created"]) + len(result["updated"])}), 200
+    except ValueError as e:
+        return jsonify({"error": f"Invalid reminder import: {e}"}), 400
+
+@app.route("/reminders/export", methods=["GET"])
+def export_reminders():
+    """Stream reminders as JSONL."""
+    if ren_agent is None:
+        return jsonify({"error": "Agent not initialized"}), 503
+    user = request.args.get("user")
+    return Response(agent_for_request().scheduler.export_jsonl(user=user), mimetype="application/x-ndjson")
+
+@app.route("/reminders/notified", methods=["DELETE"])
+def clear_notified_reminders():
+    """Delete every reminder that has already fired."""
+    if ren_agent is None:
+        return jsonify({"error": "Agent not initialized"}), 503
+    cleared = agent_for_request().scheduler.clear_notified(user=request.args.get("user"))
+    return jsonify({"cleared": cleared}), 200
+
+@app.route("/history", methods=["GET"])
+def conversation_history():
+    """Stream logged conversation entries as JSONL, filtered by turn index (start/end) or time (since/until)."""
+    if ren_agent is None:
+        return jsonify({"error": "Agent not initialized"}), 503
+    entries = agent_for_request().history.read(
+        start_turn=request.args.get("start", type=int),
+        end_turn=request.args.get("end", type=int),
+        since=request.args.get("since", type=float),
+        until=request.args.get("until", type=float),
+    )
+    return Response((json.dumps(entry) + "\n" for entry in entries), mimetype="application/x-ndjson")
+
 @app.route("/health", methods=["GET"])
 def health_check():
     """Health check endpoint."""
@@ -228,11 +473,31 @@ def health_check():
     return jsonify({
         "status": "healthy",
         "agent_initialized": ren_agent is not None,
+        "resident_users": user_agents.stats(),
+        "sentiment_backend": sentiment_backend(),
+        "sentiment_batching": sentiment_batcher.stats(),
+        "sentiment_cache": tone_cache.stats(),
+        "sentiment_tiers": tier_stats(),
         "voice_enabled": config.is_voice_enabled(),
+        "voice_endpointing": endpoint_latency_stats(),
+        "tts_cache": tts_cache.stats(),
         "missing_config": missing_config,
-        "whisper_model": config.WHISPER_MODEL
+        "whisper_model": config.WHISPER_MODEL,
+        "transcribe_backend": config.TRANSCRIBE_BACKEND,
+        "transcription_pool": transcription_pool_stats()
     })
 
+@app.route("/ready", methods=["GET"])
+def readiness_check():
+    """Per-model load state and timings; 200 once every model is warmed up, 503 until then."""
+    status = models.status()
+    return jsonify(status), 200 if status["ready"] else 503
+
+@app.route("/models", methods=["GET"])
+def model_status():
+    """Every registered model: configured size, state, load time, memory and last use."""
+    return jsonify(models.status())
+
 @app.route("/config", methods=["GET"])
 def get_config():
     """Get current configuration status."""
@@ -253,44 +518,47 @@ def get_config():
     
 @app.route("/checkin", methods=["GET", "POST", "DELETE"])
 def checkin():
-    global checkin_state
+    """Drive the requesting user's check-in; the state lives on their agent."""
+    if ren_agent is None:
+        return jsonify({"error": "Agent not initialized"}), 503
+    data = request.get_json(silent=True) or {}
+    agent = agent_for_request({"user_id": data.get("user_id") or request.args.get("user_id")})
 
     # GET => status
     if request.method == "GET":
         return jsonify({
-            "active": checkin_state.active,
-            "phase": checkin_state.phase,
-            "summary": checkin_state.summary
+            "active": agent.checkin_state.active,
+            "phase": agent.checkin_state.phase,
+            "summary": agent.checkin_state.summary
         }), 200
 
     # DELETE => cancel
     if request.method == "DELETE":
-        checkin_state = CheckInState()  # reset
+        agent.checkin_state = CheckInState()  # reset
         return jsonify({"ok": True, "active": False}), 200
 
     # POST => start or progress the flow
-    data = request.get_json(silent=True) or {}
     user_input = (data.get("message") or "").strip()
 
     # start if inactive or no user input provided
-    if not checkin_state.active and not user_input:
-        checkin_state = CheckInState(active=True, phase="intro")
+    if not agent.checkin_state.active and not user_input:
+        agent.checkin_state = CheckInState(active=True, phase="intro")
         return jsonify({
             "active": True,
-            "phase": checkin_state.phase,
+            "phase": agent.checkin_state.phase,
             "reply": "Let’s do a quick check-in. How are you feeling right now?"
         }), 200
 
     # progress the flow
-    new_state, reply, done = handle_checkin_input(checkin_state, user_input)
-    checkin_state = new_state
+    new_state, reply, done = handle_checkin_input(agent.checkin_state, user_input)
+    agent.checkin_state = new_state
     if done:
-        # optional: persist summary via ren_agent.memory_store if you want
-        checkin_state = CheckInState()  # reset after wrap
+        # optional: persist summary via agent.memory_store if you want
+        agent.checkin_state = CheckInState()  # reset after wrap
 
     return jsonify({
-        "active": checkin_state.active,
-        "phase": checkin_state.phase,
+        "active": agent.checkin_state.active,
+        "phase": agent.checkin_state.phase,
         "reply": reply,
         "done": done
     }), 200
@@ -303,11 +571,24 @@ def not_found(error):
 def method_not_allowed(error):
     return jsonify({"error": "Method not allowed"}), 405
 
+@app.errorhandler(ModelNotReady)
+def model_not_ready(error):
+    return jsonify({
+        "error": str(error),
+        "model": error.name,
+        "state": error.state,
+    }), 503, {"Retry-After": str(error.retry_after)}
+
 @app.errorhandler(500)
 def internal_error(error):
     logger.error(f"Internal server error: {error}")
     return jsonify({"error": "Internal server error"}), 500
 
+# Models load on background threads, so the server binds (and /health, /ready
+# answer) straight away; endpoints that need a model return 503 until it's warm
+if config.MODEL_PRELOAD:
+    models.start()
+
 if __name__ == "__main__":
     missing_config = config.validate_required_config()
     if missing_config:
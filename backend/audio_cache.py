@@ -0,0 +1,113 @@
+# audio_cache.py
+# Content-addressed, size-capped LRU cache of synthesized speech on disk
+
+from collections import OrderedDict
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from typing import Any, Dict, Optional
+
+def speech_key(text: str, voice_id: Optional[str], style: str, settings: Dict[str, Any]) -> str:
+    """SHA-256 over everything that changes the synthesized audio."""
+    material = json.dumps({"text": text, "voice": voice_id, "style": style, "settings": settings},
+                          sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+class AudioCache:
+    """
+    Stores audio bytes as `<directory>/<key[:2]>/<key>.mp3` and keeps the total
+    under `max_bytes`, evicting the least recently used files first.
+
+    Recency is the file's mtime, bumped on every hit, so the LRU order survives
+    restarts: the index is rebuilt from a directory scan at startup. Files are
+    written to a temp name and renamed into place, so a crash never leaves a
+    truncated clip behind a valid key.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max(0, max_bytes)
+        self._index: "OrderedDict[str, int]" = OrderedDict()  # key -> size, least recent first
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if self.max_bytes:
+            self._scan()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.mp3")
+
+    def _scan(self) -> None:
+        found = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                path = os.path.join(root, name)
+                if name.endswith(".tmp"):
+                    os.remove(path)  # left over from an interrupted write
+                elif name.endswith(".mp3"):
+                    stat = os.stat(path)
+                    found.append((stat.st_mtime, name[:-4], stat.st_size))
+        for _, key, size in sorted(found):
+            self._index[key] = size
+            self._bytes += size
+        self._evict()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            if key not in self._index:
+                self.misses += 1
+                return None
+            self._index.move_to_end(key)
+            self.hits += 1
+        try:
+            with open(self._path(key), "rb") as f:
+                data = f.read()
+            os.utime(self._path(key))
+            return data
+        except OSError:
+            with self._lock:  # deleted behind our back
+                self._bytes -= self._index.pop(key, 0)
+            return None
+
+    def put(self, key: str, data: bytes) -> None:
+        if not self.max_bytes or not data or len(data) > self.max_bytes:
+            return
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._bytes += len(data) - self._index.pop(key, 0)
+            self._index[key] = len(data)
+            self._evict()
+
+    def _evict(self) -> None:
+        while self._bytes > self.max_bytes and self._index:
+            key, size = self._index.popitem(last=False)
+            self._bytes -= size
+            self.evictions += 1
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._index),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,150 @@
+# audio_decode.py
+# Decodes uploaded audio in memory to 16 kHz mono float32, the input Whisper expects
+
+import re
+import struct
+import subprocess
+from typing import BinaryIO, Optional
+
+import numpy as np
+
+from config import config
+
+SAMPLE_RATE = 16000
+READ_CHUNK = 64 * 1024
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+class AudioTooLarge(ValueError):
+    """The upload is bigger than config.TRANSCRIBE_MAX_BYTES."""
+
+class AudioTooLong(ValueError):
+    """The audio runs longer than config.TRANSCRIBE_MAX_SECONDS (TRANSCRIBE_LONG_MAX_SECONDS for split uploads)."""
+
+def read_limited(stream: BinaryIO, max_bytes: Optional[int] = None) -> bytes:
+    """Read a stream into memory, giving up as soon as it exceeds `max_bytes`."""
+    max_bytes = max_bytes or config.TRANSCRIBE_MAX_BYTES
+    chunks, size = [], 0
+    while True:
+        chunk = stream.read(READ_CHUNK)
+        if not chunk:
+            return b"".join(chunks)
+        size += len(chunk)
+        if size > max_bytes:
+            raise AudioTooLarge(f"Audio upload exceeds {max_bytes} bytes")
+        chunks.append(chunk)
+
+def decode_audio(data: bytes, content_type: Optional[str] = None, max_seconds: Optional[float] = None) -> np.ndarray:
+    """
+    Decode an audio upload to 16 kHz mono float32 samples without touching disk.
+
+    WAV (integer or float PCM) and raw PCM bodies (`audio/pcm`, little-endian
+    16-bit, or `audio/L16`, big-endian, with optional `rate=` / `channels=`
+    parameters) are decoded natively. Anything else is piped through ffmpeg.
+    """
+    max_seconds = max_seconds or config.TRANSCRIBE_MAX_SECONDS
+    if not data:
+        raise ValueError("Empty audio upload")
+    mimetype, params = _parse_content_type(content_type)
+    if data[:4] == b"RIFF" and data[8:12] == b"WAVE":
+        return _decode_wav(data, max_seconds)
+    if mimetype in ("audio/pcm", "audio/l16"):
+        rate = int(params.get("rate", SAMPLE_RATE))
+        channels = int(params.get("channels", 1))
+        dtype = ">i2" if mimetype == "audio/l16" else "<i2"
+        _check_duration(len(data) // (2 * channels), rate, max_seconds)
+        samples = np.frombuffer(data[:len(data) - len(data) % (2 * channels)], dtype=dtype)
+        return _to_mono_16k(samples.astype(np.float32) / 32768.0, channels, rate)
+    return _decode_ffmpeg(data, max_seconds)
+
+# ── Helpers ──────────────────────────────────────
+def _parse_content_type(content_type: Optional[str]):
+    if not content_type:
+        return None, {}
+    mimetype, *rest = [part.strip() for part in content_type.split(";")]
+    params = dict(part.split("=", 1) for part in rest if "=" in part)
+    return mimetype.lower(), {k.strip().lower(): v.strip() for k, v in params.items()}
+
+def _check_duration(frames: int, rate: int, max_seconds: float) -> None:
+    if rate <= 0:
+        raise ValueError(f"Invalid sample rate {rate}")
+    if frames / rate > max_seconds:
+        raise AudioTooLong(f"Audio is {frames / rate:.1f}s long; the limit is {max_seconds:g}s")
+
+def _decode_wav(data: bytes, max_seconds: float) -> np.ndarray:
+    fmt, pcm = None, None
+    pos = 12
+    while pos + 8 <= len(data):
+        chunk_id = data[pos:pos + 4]
+        size = struct.unpack_from("<I", data, pos + 4)[0]
+        body = pos + 8
+        if chunk_id == b"fmt " and size >= 16:
+            fmt = list(struct.unpack_from("<HHIIHH", data, body))
+            if fmt[0] == WAVE_FORMAT_EXTENSIBLE and size >= 26:
+                fmt[0] = struct.unpack_from("<H", data, body + 24)[0]  # first two bytes of the subformat GUID
+        elif chunk_id == b"data":
+            # Streaming writers leave the size at 0 / 0xFFFFFFFF; take the rest of the body
+            end = body + size if 0 < size and body + size <= len(data) else len(data)
+            pcm = memoryview(data)[body:end]
+            break
+        pos = body + size + (size & 1)
+    if fmt is None or pcm is None:
+        raise ValueError("Malformed WAV file: missing fmt or data chunk")
+
+    format_tag, channels, rate, _, block_align, bits = fmt
+    if channels < 1 or block_align < 1:
+        raise ValueError("Malformed WAV file: bad channel layout")
+    frames = len(pcm) // block_align
+    _check_duration(frames, rate, max_seconds)
+    pcm = pcm[:frames * block_align]
+
+    if format_tag == WAVE_FORMAT_PCM and bits == 8:
+        samples = (np.frombuffer(pcm, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+    elif format_tag == WAVE_FORMAT_PCM and bits == 16:
+        samples = np.frombuffer(pcm, dtype="<i2").astype(np.float32) / 32768.0
+    elif format_tag == WAVE_FORMAT_PCM and bits == 24:
+        raw = np.frombuffer(pcm, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        value = raw[:, 0] | (raw[:, 1] << 8) | (raw[:, 2] << 16)
+        samples = (np.where(value & 0x800000, value - 0x1000000, value)).astype(np.float32) / 8388608.0
+    elif format_tag == WAVE_FORMAT_PCM and bits == 32:
+        samples = np.frombuffer(pcm, dtype="<i4").astype(np.float32) / 2147483648.0
+    elif format_tag == WAVE_FORMAT_IEEE_FLOAT and bits in (32, 64):
+        samples = np.frombuffer(pcm, dtype="<f4" if bits == 32 else "<f8").astype(np.float32)
+    else:
+        raise ValueError(f"Unsupported WAV encoding (format {format_tag:#x}, {bits}-bit)")
+    return _to_mono_16k(samples, channels, rate)
+
+def _to_mono_16k(samples: np.ndarray, channels: int, rate: int) -> np.ndarray:
+    if channels > 1:
+        samples = samples[:len(samples) - len(samples) % channels].reshape(-1, channels).mean(axis=1)
+    if rate != SAMPLE_RATE and len(samples):
+        if rate % SAMPLE_RATE == 0:
+            # 32/44.1/48 kHz: average each group of input samples (a box low-pass) while decimating
+            factor = rate // SAMPLE_RATE
+            samples = samples[:len(samples) - len(samples) % factor].reshape(-1, factor).mean(axis=1)
+        else:
+            count = int(round(len(samples) * SAMPLE_RATE / rate))
+            samples = np.interp(np.arange(count) * (rate / SAMPLE_RATE), np.arange(len(samples)), samples)
+    return np.ascontiguousarray(samples, dtype=np.float32)
+
+def _decode_ffmpeg(data: bytes, max_seconds: float) -> np.ndarray:
+    # Decode up to a little past the limit so over-long uploads are detected, not silently cut
+    cmd = [
+        config.FFMPEG_BINARY, "-nostdin", "-hide_banner", "-loglevel", "error", "-threads", "0",
+        "-i", "pipe:0", "-t", f"{max_seconds + 1:g}",
+        "-f", "s16le", "-ac", "1", "-ar", str(SAMPLE_RATE), "pipe:1",
+    ]
+    try:
+        result = subprocess.run(cmd, input=data, capture_output=True, timeout=config.AUDIO_DECODE_TIMEOUT)
+    except FileNotFoundError:
+        raise RuntimeError("ffmpeg is required to decode non-WAV audio but was not found")
+    except subprocess.TimeoutExpired:
+        raise RuntimeError(f"ffmpeg took longer than {config.AUDIO_DECODE_TIMEOUT}s to decode the upload")
+    if result.returncode != 0 or not result.stdout:
+        message = re.sub(r"\s+", " ", result.stderr.decode("utf-8", "replace")).strip()
+        raise ValueError(f"Could not decode audio: {message or 'no audio stream'}")
+    samples = np.frombuffer(result.stdout, dtype="<i2")
+    _check_duration(len(samples), SAMPLE_RATE, max_seconds)
+    return samples.astype(np.float32) / 32768.0
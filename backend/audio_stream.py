@@ -0,0 +1,140 @@
+# audio_stream.py
+# Fixed-size float32 ring buffer for live audio, plus text de-duplication for overlapping decode windows
+
+import re
+import threading
+from typing import List, Optional
+
+import numpy as np
+
+from config import config
+
+SAMPLE_RATE = 16000
+
+class AudioRingBuffer:
+    """
+    Preallocated float32 ring buffer holding the most recent `capacity` samples.
+
+    `write` copies a block in with at most two slice assignments (no
+    per-sample Python objects), so it is cheap enough to call from the audio
+    callback; memory stays at `capacity` floats however long the stream runs.
+    `total_written` counts every sample ever written, which lets readers track
+    how much new audio has arrived since their last window.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._buffer = np.zeros(capacity, dtype=np.float32)
+        self._pos = 0  # next write index
+        self.total_written = 0
+        self._cond = threading.Condition()
+
+    def write(self, samples: np.ndarray) -> None:
+        samples = np.asarray(samples, dtype=np.float32).reshape(-1)
+        if len(samples) > self.capacity:
+            samples = samples[-self.capacity:]
+        with self._cond:
+            first = min(len(samples), self.capacity - self._pos)
+            self._buffer[self._pos:self._pos + first] = samples[:first]
+            self._buffer[:len(samples) - first] = samples[first:]
+            self._pos = (self._pos + len(samples)) % self.capacity
+            self.total_written += len(samples)
+            self._cond.notify_all()
+
+    def latest(self, count: int) -> np.ndarray:
+        """Copy of the last `count` samples (fewer if not written yet), oldest first."""
+        with self._cond:
+            count = min(count, self.capacity, self.total_written)
+            start = (self._pos - count) % self.capacity
+            if start + count <= self.capacity:
+                return self._buffer[start:start + count].copy()
+            return np.concatenate((self._buffer[start:], self._buffer[:self._pos]))
+
+    def wait_for(self, total: int, timeout: Optional[float] = None) -> bool:
+        """Block until `total_written` reaches `total`; False on timeout."""
+        with self._cond:
+            return self._cond.wait_for(lambda: self.total_written >= total, timeout)
+
+_WORD = re.compile(r"[^\w']+")
+
+def _norm(word: str) -> str:
+    return _WORD.sub("", word).lower()
+
+def merge_overlap(previous: str, current: str, max_words: int = 30) -> str:
+    """
+    Return the part of `current` not already said at the end of `previous`.
+
+    Consecutive windows share `overlap` seconds of audio, so the start of a
+    window's transcript usually repeats the end of the last one. The longest
+    run of words (compared without case or punctuation) that ends `previous`
+    and starts `current` is dropped.
+    """
+    words: List[str] = current.split()
+    if not previous or not words:
+        return current.strip()
+    tail = [_norm(w) for w in previous.split()[-max_words:]]
+    head = [_norm(w) for w in words[:max_words]]
+    for size in range(min(len(tail), len(head)), 0, -1):
+        if tail[-size:] == head[:size]:
+            return " ".join(words[size:])
+    return current.strip()
+
+class WindowedTranscriber:
+    """
+    Incremental transcription of a live 16 kHz stream, shared by the local
+    microphone loop and the /stream WebSocket.
+
+    Audio goes in with `write` (cheap enough for an audio callback). Every
+    `step_seconds` of new audio, `decode` transcribes the newest step plus
+    `overlap_seconds` of the previous window, so words cut at a window edge
+    are heard whole in the next one, and returns only the words not already
+    emitted. `flush` decodes whatever arrived after the last window.
+    """
+
+    def __init__(self, model, step_seconds: Optional[float] = None, overlap_seconds: Optional[float] = None,
+                 language: Optional[str] = "en", slack_samples: int = SAMPLE_RATE):
+        self.model = model
+        self.language = language
+        self.step_samples = int(SAMPLE_RATE * (step_seconds or config.STREAM_STEP_SECONDS))
+        overlap = config.STREAM_OVERLAP_SECONDS if overlap_seconds is None else overlap_seconds
+        self.window_samples = self.step_samples + int(SAMPLE_RATE * overlap)
+        self.ring = AudioRingBuffer(self.window_samples + slack_samples)
+        self.next_decode = self.step_samples
+        self.decoded_to = 0  # total_written at the last decode
+        self.previous_text = ""
+        self.pieces: List[str] = []
+
+    def write(self, samples: np.ndarray) -> None:
+        self.ring.write(samples)
+
+    def ready(self) -> bool:
+        return self.ring.total_written >= self.next_decode
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until the next window is due; False on timeout."""
+        return self.ring.wait_for(self.next_decode, timeout)
+
+    def decode(self) -> str:
+        # If decoding fell behind, skip ahead rather than queueing stale windows
+        self.next_decode = max(self.next_decode, self.ring.total_written) + self.step_samples
+        return self._decode(self.window_samples)
+
+    def flush(self) -> str:
+        """Decode the audio written since the last window (plus the usual overlap), if any."""
+        pending = self.ring.total_written - self.decoded_to
+        if pending <= 0:
+            return ""
+        return self._decode(pending + self.window_samples - self.step_samples)
+
+    @property
+    def transcript(self) -> str:
+        return " ".join(self.pieces)
+
+    def _decode(self, count: int) -> str:
+        self.decoded_to = self.ring.total_written
+        text = self.model.transcribe(self.ring.latest(count), language=self.language)["text"]
+        new_text = merge_overlap(self.previous_text, text)
+        self.previous_text = text
+        if new_text:
+            self.pieces.append(new_text)
+        return new_text
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Benchmark PersistentMemory snapshot codecs.
+
+Builds synthetic memories (reminders plus exchange history) of roughly 1, 10
+and 100 MB and reports save time, load time and file size for every installed
+codec against the legacy format (indented stdlib json, loaded with json.load).
+
+    python bench_memory_codec.py [--sizes 1 10 100] [--repeat 3]
+"""
+
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+from memory_codec import available_codecs, decode, encode
+
+def build_memory(target_mb: float) -> dict:
+    rng = random.Random(42)
+    words = ["focus", "tired", "meeting", "coffee", "walk", "call", "mom", "gym", "deadline", "music"]
+    memory = {
+        "user_name": "Ada",
+        "last_sentiment": {"text": "hi", "sentiment": "calm", "raw_label": "neutral", "confidence": 0.91},
+        "reminders": [],
+        "history": [],
+    }
+    # ~ bytes per item in the legacy indented-JSON encoding
+    per_item = 250
+    for i in range(int(target_mb * 1024 * 1024 / per_item)):
+        sentence = " ".join(rng.choice(words) for _ in range(12))
+        if i % 4 == 0:
+            memory["reminders"].append({
+                "id": f"ada-{1700000000 + i}", "user": "Ada", "task": sentence[:40],
+                "time": f"{rng.randint(1, 12)}:{rng.randint(0, 59):02d} PM",
+                "due_at": 1700000000.0 + i, "notified": bool(i % 3),
+            })
+        else:
+            memory["history"].append({
+                "turn": i, "timestamp": 1700000000.0 + i, "user": sentence,
+                "ren": sentence[::-1], "tone": rng.choice(["calm", "warm", "low"]),
+            })
+    return memory
+
+def bench(memory: dict, codec: str, repeat: int) -> dict:
+    path = os.path.join(tempfile.mkdtemp(), "memory.bin")
+    save_times, load_times = [], []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        with open(path, "wb") as f:
+            f.write(encode(memory, codec))
+        save_times.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        with open(path, "rb") as f:
+            # The legacy baseline loads the way PersistentMemory used to: stdlib json.load
+            json.load(f) if codec == "json" else decode(f.read())
+        load_times.append(time.perf_counter() - start)
+    size = os.path.getsize(path)
+    os.remove(path)
+    return {"save_ms": min(save_times) * 1000, "load_ms": min(load_times) * 1000, "size_mb": size / 1024 / 1024}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=float, nargs="+", default=[1, 10, 100], help="target sizes in MB")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    codecs = available_codecs()
+    print(f"{'size':>7}  {'codec':<13} {'save ms':>9} {'load ms':>9} {'file MB':>8}  vs json (save/load/size)")
+    for target in args.sizes:
+        memory = build_memory(target)
+        baseline = None
+        for codec in codecs:
+            result = bench(memory, codec, args.repeat)
+            baseline = baseline or result
+            print(
+                f"{target:>5g}MB  {codec:<13} {result['save_ms']:>9.1f} {result['load_ms']:>9.1f} "
+                f"{result['size_mb']:>8.2f}  "
+                f"{baseline['save_ms'] / result['save_ms']:.1f}x / {baseline['load_ms'] / result['load_ms']:.1f}x / "
+                f"{result['size_mb'] / baseline['size_mb']:.2f}"
+            )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Parity and latency check for the int8 ONNX sentiment backend.
+
+Exports the quantized model if it isn't cached yet, then runs a sample corpus
+through both the full-precision torch model and the ONNX Runtime artifact.
+Reports label agreement (exits non-zero below --min-agreement) and per-call
+latency at batch size 1 and --batch-size.
+
+    python bench_sentiment.py [--repeat 5] [--batch-size 16] [--min-agreement 0.95]
+"""
+
+import argparse
+import statistics
+import sys
+import time
+
+import numpy as np
+import torch
+from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+from config import config
+from sentiment_onnx import load_quantized
+
+CORPUS = [
+    "I finally finished the project and it feels amazing.",
+    "Honestly I'm exhausted, today was way too long.",
+    "Remind me to call mom at 7.",
+    "Why does nothing ever work the first time?",
+    "Thanks Ren, that actually helped a lot.",
+    "I don't know, I guess it's fine.",
+    "I'm really nervous about the interview tomorrow.",
+    "That was the best concert I've been to in years!",
+    "My flight got cancelled again. Unbelievable.",
+    "Can you play something calm?",
+    "I miss how things used to be.",
+    "Wow, I did not expect that at all.",
+    "Stop interrupting me.",
+    "It's raining, so I'm staying in tonight.",
+    "I think I'm getting sick, my head hurts.",
+    "We won the game!",
+    "Set a timer for twenty minutes.",
+    "Everyone forgot my birthday.",
+    "I'm proud of how far I've come this year.",
+    "What's on my schedule for tomorrow?",
+    "I can't believe they lied to me.",
+    "Kind of bored, not sure what to do.",
+    "The doctor said the results look good.",
+    "I keep thinking something bad is going to happen.",
+    "Let's go for a walk later.",
+    "This traffic is driving me insane.",
+    "I love the way the light looks this morning.",
+    "Meh. Same as always.",
+    "I lost my keys and I'm going to be late.",
+    "Good night, Ren.",
+    "I really messed up that presentation.",
+    "My sister is coming to visit next week, so excited!",
+]
+
+def torch_logits(tokenizer, model, texts):
+    inputs = tokenizer(texts, return_tensors="pt", padding=True, truncation=True, max_length=512)
+    with torch.no_grad():
+        return model(**inputs).logits.numpy()
+
+def latency_ms(fn, texts, batch_size, repeat):
+    samples = []
+    for _ in range(repeat):
+        for i in range(0, len(texts), batch_size):
+            start = time.perf_counter()
+            fn(texts[i:i + batch_size])
+            samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return statistics.median(samples), samples[int(0.95 * (len(samples) - 1))]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--artifact-dir", default=config.SENTIMENT_ONNX_DIR)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--batch-size", type=int, default=config.SENTIMENT_BATCH_SIZE)
+    parser.add_argument("--min-agreement", type=float, default=0.95)
+    args = parser.parse_args()
+
+    tokenizer = AutoTokenizer.from_pretrained(config.SENTIMENT_MODEL)
+    model = AutoModelForSequenceClassification.from_pretrained(config.SENTIMENT_MODEL).eval()
+    onnx_model = load_quantized(config.SENTIMENT_MODEL, args.artifact_dir, export=True)
+    if onnx_model is None:
+        sys.exit("Could not export or load the quantized model")
+
+    torch_fn = lambda texts: torch_logits(tokenizer, model, texts)
+    reference, quantized = torch_fn(CORPUS), onnx_model.logits(CORPUS)
+    agree = reference.argmax(axis=1) == quantized.argmax(axis=1)
+    agreement = float(agree.mean())
+    print(f"Label agreement: {agree.sum()}/{len(CORPUS)} ({agreement:.1%}), "
+          f"max |logit diff| {np.abs(reference - quantized).max():.3f}")
+    for text, ref, quant in zip(CORPUS, reference.argmax(axis=1), quantized.argmax(axis=1)):
+        if ref != quant:
+            print(f"  differs: {text!r}: torch={model.config.id2label[int(ref)]} onnx={onnx_model.id2label[int(quant)]}")
+
+    torch_fn(CORPUS[:1]), onnx_model.logits(CORPUS[:1])  # warm up
+    print(f"\n{'backend':<10} {'batch':>5} {'p50 ms':>8} {'p95 ms':>8} {'ms/text':>8}")
+    for batch_size in sorted({1, args.batch_size}):
+        results = {
+            "torch": latency_ms(torch_fn, CORPUS, batch_size, args.repeat),
+            "onnx-int8": latency_ms(onnx_model.logits, CORPUS, batch_size, args.repeat),
+        }
+        for name, (p50, p95) in results.items():
+            print(f"{name:<10} {batch_size:>5} {p50:>8.1f} {p95:>8.1f} {p50 / batch_size:>8.2f}")
+        print(f"{'speedup':<10} {batch_size:>5} {results['torch'][0] / results['onnx-int8'][0]:>7.1f}x")
+
+    if agreement < args.min_agreement:
+        sys.exit(f"Label agreement {agreement:.1%} is below {args.min_agreement:.0%}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Real-time factor of each transcription backend on this machine.
+
+Transcribes one or more clips with every requested backend and reports
+load time, per-clip processing time and the real-time factor
+(RTF = processing seconds / audio seconds; < 1.0 is faster than real time).
+
+    python bench_transcription.py clip.wav [more.wav ...] [--backends whisper faster-whisper]
+                                  [--model base] [--repeat 3]
+"""
+
+import argparse
+import time
+import wave
+
+import numpy as np
+
+from transcription import BACKENDS, SAMPLE_RATE, load_backend
+
+def load_audio(path: str) -> np.ndarray:
+    """16 kHz mono float32 samples; 16-bit WAV is read directly, anything else through whisper's ffmpeg loader."""
+    try:
+        with wave.open(path, "rb") as f:
+            if f.getframerate() == SAMPLE_RATE and f.getnchannels() == 1 and f.getsampwidth() == 2:
+                return np.frombuffer(f.readframes(f.getnframes()), dtype=np.int16).astype(np.float32) / 32768.0
+    except wave.Error:
+        pass
+    from whisper.audio import load_audio as ffmpeg_load
+    return ffmpeg_load(path)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("clips", nargs="+")
+    parser.add_argument("--backends", nargs="+", default=sorted(BACKENDS), choices=sorted(BACKENDS))
+    parser.add_argument("--model", default="base")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    clips = [(path, load_audio(path)) for path in args.clips]
+    audio_seconds = sum(len(audio) for _, audio in clips) / SAMPLE_RATE
+    print(f"{len(clips)} clip(s), {audio_seconds:.1f}s of audio, model '{args.model}'\n")
+    print(f"{'backend':<15} {'load s':>7} {'process s':>10} {'RTF':>6}  first transcript")
+    for name in args.backends:
+        start = time.perf_counter()
+        backend = load_backend(name, model_size=args.model)
+        load_seconds = time.perf_counter() - start
+        if backend.name != name:
+            print(f"{name:<15} not installed, skipped")
+            continue
+        backend.transcribe(np.zeros(SAMPLE_RATE, dtype=np.float32))  # warm up
+
+        best = None
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            texts = [backend.transcribe(audio)["text"] for _, audio in clips]
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        print(f"{name:<15} {load_seconds:>7.1f} {best:>10.2f} {best / audio_seconds:>6.3f}  {texts[0][:60]!r}")
+
+if __name__ == "__main__":
+    main()
@@ -18,19 +18,105 @@ class Config:
         # ElevenLabs API Configuration
         self.ELEVENLABS_API_KEY = os.getenv('ELEVENLABS_API_KEY')
         self.ELEVEN_VOICE_ID = os.getenv('ELEVEN_VOICE_ID')
+        self.TTS_CACHE_DIR = os.getenv('TTS_CACHE_DIR', 'ren_tts_cache')
+        self.TTS_CACHE_MAX_MB = float(os.getenv('TTS_CACHE_MAX_MB', '100'))  # 0 = no cache
+        self.TTS_STREAM = os.getenv('TTS_STREAM', 'true').lower() == 'true'  # /tts relays audio as it is synthesized
+        self.TTS_STREAM_CHUNK_BYTES = int(os.getenv('TTS_STREAM_CHUNK_BYTES', '4096'))
 
         # Whisper Configuration
         self.WHISPER_MODEL = os.getenv('WHISPER_MODEL', 'base')
+        self.TRANSCRIBE_BACKEND = os.getenv('TRANSCRIBE_BACKEND', 'whisper').lower()  # whisper | faster-whisper
+        self.WHISPER_COMPUTE_TYPE = os.getenv('WHISPER_COMPUTE_TYPE', 'int8')  # faster-whisper only
+        self.WHISPER_CPU_THREADS = int(os.getenv('WHISPER_CPU_THREADS', '0'))  # 0 = library default
+        self.WHISPER_BEAM_SIZE = int(os.getenv('WHISPER_BEAM_SIZE', '1'))
+
+        # Transcription worker processes (0 = transcribe in the server process)
+        self.TRANSCRIBE_WORKERS = int(os.getenv('TRANSCRIBE_WORKERS', '1'))
+        self.TRANSCRIBE_QUEUE_SIZE = int(os.getenv('TRANSCRIBE_QUEUE_SIZE', '8'))  # jobs waiting beyond this get a 503
+        self.TRANSCRIBE_TIMEOUT = float(os.getenv('TRANSCRIBE_TIMEOUT', '300'))
+
+        # Long uploads are split at pauses into chunks transcribed in parallel by the workers (0 = never split).
+        # TRANSCRIBE_MAX_SECONDS caps single-pass transcription; split uploads may run to TRANSCRIBE_LONG_MAX_SECONDS.
+        # The whole upload is decoded in the request process first, at 64 KB per second of audio
+        # (16 kHz float32): the 1800 s default is ~115 MB per request, 7200 s would be ~460 MB.
+        self.TRANSCRIBE_LONG_SECONDS = float(os.getenv('TRANSCRIBE_LONG_SECONDS', '60'))
+        self.TRANSCRIBE_LONG_MAX_SECONDS = float(os.getenv('TRANSCRIBE_LONG_MAX_SECONDS', '1800'))
+        self.TRANSCRIBE_CHUNK_SECONDS = float(os.getenv('TRANSCRIBE_CHUNK_SECONDS', '30'))
+        self.TRANSCRIBE_MIN_SILENCE_MS = int(os.getenv('TRANSCRIBE_MIN_SILENCE_MS', '300'))
 
         # Audio Configuration
         self.AUDIO_SAMPLE_RATE = int(os.getenv('AUDIO_SAMPLE_RATE', '16000'))
         self.AUDIO_DURATION = int(os.getenv('AUDIO_DURATION', '4'))
+        self.STREAM_STEP_SECONDS = float(os.getenv('STREAM_STEP_SECONDS', '3'))  # new audio per live decode
+        self.STREAM_OVERLAP_SECONDS = float(os.getenv('STREAM_OVERLAP_SECONDS', '1'))  # carried over from the last window
+
+        # Voice activity endpointing for listen_to_voice (webrtcvad)
+        self.VAD_ENABLED = os.getenv('VAD_ENABLED', 'true').lower() == 'true'
+        self.VAD_AGGRESSIVENESS = int(os.getenv('VAD_AGGRESSIVENESS', '2'))  # 0 (lenient) .. 3 (strict)
+        self.VAD_FRAME_MS = int(os.getenv('VAD_FRAME_MS', '30'))
+        self.VAD_SILENCE_MS = int(os.getenv('VAD_SILENCE_MS', '700'))  # trailing silence that ends an utterance
+        self.VAD_MAX_SECONDS = float(os.getenv('VAD_MAX_SECONDS', '15'))
+
+        # Uploaded audio (/transcribe) limits and decoding
+        self.TRANSCRIBE_MAX_BYTES = int(os.getenv('TRANSCRIBE_MAX_BYTES', str(25 * 1024 * 1024)))
+        self.TRANSCRIBE_MAX_SECONDS = float(os.getenv('TRANSCRIBE_MAX_SECONDS', '600'))  # also caps /stream sessions
+        self.FFMPEG_BINARY = os.getenv('FFMPEG_BINARY', 'ffmpeg')
+        self.AUDIO_DECODE_TIMEOUT = float(os.getenv('AUDIO_DECODE_TIMEOUT', '60'))
 
         # Agent Configuration
         self.MEMORY_THRESHOLD = int(os.getenv('MEMORY_THRESHOLD', '20'))
         self.AGENT_NAME = os.getenv('AGENT_NAME', 'Ren')
         self.AGENT_PERSONALITY = os.getenv('AGENT_PERSONALITY', 'calm, introspective, articulate — poetic when needed, with quiet authority')
 
+        # Persistent memory storage ('json' file or 'sqlite' database)
+        self.MEMORY_BACKEND = os.getenv('MEMORY_BACKEND', 'json').lower()
+        self.MEMORY_DB_FILE = os.getenv('MEMORY_DB_FILE', 'ren_memory.db')
+        self.MEMORY_JOURNAL = os.getenv('MEMORY_JOURNAL', 'false').lower() == 'true'
+        self.MEMORY_COMPACT_EVERY = int(os.getenv('MEMORY_COMPACT_EVERY', '500'))
+        self.MEMORY_FLUSH_INTERVAL_MS = int(os.getenv('MEMORY_FLUSH_INTERVAL_MS', '0'))
+        self.MEMORY_CODEC = os.getenv('MEMORY_CODEC', 'orjson')  # json | orjson | msgpack | msgpack+zlib
+        self.MEMORY_USER_DIR = os.getenv('MEMORY_USER_DIR', 'ren_users')
+        self.MEMORY_RESIDENT_USERS = int(os.getenv('MEMORY_RESIDENT_USERS', '64'))
+
+        # Conversation history log
+        self.CONVERSATION_LOG_DIR = os.getenv('CONVERSATION_LOG_DIR', 'ren_history')
+        self.CONVERSATION_SEGMENT_BYTES = int(os.getenv('CONVERSATION_SEGMENT_BYTES', str(1024 * 1024)))
+
+        # Long-term memory recall (embedding index over past exchanges)
+        self.LONG_TERM_MEMORY = os.getenv('LONG_TERM_MEMORY', 'true').lower() == 'true'
+        self.MEMORY_INDEX_DIR = os.getenv('MEMORY_INDEX_DIR', 'ren_memory_index')
+        self.EMBEDDING_MODEL = os.getenv('EMBEDDING_MODEL', 'sentence-transformers/all-MiniLM-L6-v2')
+        self.MEMORY_RECALL_K = int(os.getenv('MEMORY_RECALL_K', '5'))
+        self.MEMORY_RECALL_MIN_SCORE = float(os.getenv('MEMORY_RECALL_MIN_SCORE', '0.3'))
+        self.MEMORY_INDEX_HNSW = os.getenv('MEMORY_INDEX_HNSW', 'true').lower() == 'true'
+        self.MEMORY_INDEX_HNSW_MIN = int(os.getenv('MEMORY_INDEX_HNSW_MIN', '20000'))
+
+        # Model loading: load in the background at startup (otherwise on first use)
+        self.MODEL_PRELOAD = os.getenv('MODEL_PRELOAD', 'true').lower() == 'true'
+        self.MODEL_RETRY_AFTER = int(os.getenv('MODEL_RETRY_AFTER', '10'))
+        self.MODEL_MEMORY_BUDGET_MB = float(os.getenv('MODEL_MEMORY_BUDGET_MB', '0'))  # 0 = never unload
+        self.MODEL_IDLE_SECONDS = float(os.getenv('MODEL_IDLE_SECONDS', '600'))  # unused this long = may be unloaded
+
+        # Sentiment model backend ('torch' or 'onnx' for the int8-quantized export)
+        self.SENTIMENT_MODEL = os.getenv('SENTIMENT_MODEL', 'MarieAngeA13/Sentiment-Analysis-BERT')
+        self.SENTIMENT_BACKEND = os.getenv('SENTIMENT_BACKEND', 'torch').lower()
+        self.SENTIMENT_ONNX_DIR = os.getenv('SENTIMENT_ONNX_DIR', 'ren_models/sentiment-int8')
+        self.SENTIMENT_ONNX_AUTO_EXPORT = os.getenv('SENTIMENT_ONNX_AUTO_EXPORT', 'false').lower() == 'true'
+
+        # Lexicon tier that labels formulaic turns without running the model
+        self.TONE_LEXICON = os.getenv('TONE_LEXICON', 'true').lower() == 'true'
+        self.TONE_LEXICON_MAX_WORDS = int(os.getenv('TONE_LEXICON_MAX_WORDS', '6'))
+
+        # Sentiment inference micro-batching
+        self.SENTIMENT_BATCH_SIZE = int(os.getenv('SENTIMENT_BATCH_SIZE', '16'))
+        self.SENTIMENT_BATCH_WAIT_MS = float(os.getenv('SENTIMENT_BATCH_WAIT_MS', '5'))
+
+        # Sentiment result cache (SENTIMENT_CACHE_SIZE=0 disables it, empty file = memory only)
+        self.SENTIMENT_CACHE_SIZE = int(os.getenv('SENTIMENT_CACHE_SIZE', '4096'))
+        self.SENTIMENT_CACHE_TTL = float(os.getenv('SENTIMENT_CACHE_TTL', '86400'))
+        self.SENTIMENT_CACHE_MAX_CHARS = int(os.getenv('SENTIMENT_CACHE_MAX_CHARS', '200'))
+        self.SENTIMENT_CACHE_FILE = os.getenv('SENTIMENT_CACHE_FILE', 'ren_models/sentiment_cache.json')
+
         # Background task manager toggle
         self.ENABLE_BACKGROUND_TASKS = os.getenv('ENABLE_BACKGROUND_TASKS', 'true').lower() == 'true'
 
@@ -0,0 +1,140 @@
+# conversation_history.py
+# Hot in-memory window of recent exchanges plus an append-only, size-rotated segment log of all of them
+
+from bisect import bisect_right
+from collections import deque
+import json
+import os
+import threading
+import time
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
+
+SEGMENT_PREFIX = "segment-"
+SEGMENT_SUFFIX = ".jsonl"
+
+class ConversationHistory:
+    """
+    Conversation history with two tiers.
+
+    The hot window is a fixed-capacity ring buffer (a bounded deque, so appends
+    and evictions are O(1)) used for summaries and prompt assembly. When
+    `log_dir` is set every entry is also appended to JSONL segment files that
+    rotate at `segment_bytes`; segment names carry the first turn index and
+    timestamp they hold, so range reads only open the segments they need.
+    """
+
+    def __init__(self, capacity: int, log_dir: Optional[str] = None, segment_bytes: int = 1024 * 1024):
+        self.capacity = capacity
+        self.log_dir = log_dir
+        self.segment_bytes = segment_bytes
+        self._hot: Deque[Dict[str, Any]] = deque(maxlen=capacity)
+        self._lock = threading.Lock()
+        self._segments: List[Tuple[int, float, str]] = []  # (first turn, first timestamp, path)
+        self._next_turn = 0
+
+        if log_dir:
+            os.makedirs(log_dir, exist_ok=True)
+            self._segments = self._scan_segments()
+            self._next_turn = self._last_turn() + 1
+
+    # ── Writing ──────────────────────────────────────
+    def append(self, entry: Dict[str, Any], hot: bool = True) -> Dict[str, Any]:
+        """
+        Record one entry, stamping it with its turn index and timestamp.
+        With hot=False it only goes to the segment log, not the hot window.
+        """
+        with self._lock:
+            record = {"turn": self._next_turn, "timestamp": time.time(), **entry}
+            self._next_turn += 1
+            if hot:
+                self._hot.append(record)
+            if self.log_dir:
+                self._write(record)
+        return record
+
+    def _write(self, record: Dict[str, Any]) -> None:
+        try:
+            if not self._segments or os.path.getsize(self._segments[-1][2]) >= self.segment_bytes:
+                self._segments.append(self._new_segment(record))
+            with open(self._segments[-1][2], "a") as f:
+                f.write(json.dumps(record) + "\n")
+        except Exception as e:
+            print(f"[ConversationHistory] Error writing segment: {e}")
+
+    def _new_segment(self, record: Dict[str, Any]) -> Tuple[int, float, str]:
+        name = f"{SEGMENT_PREFIX}{record['turn']:010d}-{record['timestamp']:.3f}{SEGMENT_SUFFIX}"
+        return record["turn"], record["timestamp"], os.path.join(self.log_dir, name)
+
+    # ── Hot window ───────────────────────────────────
+    def recent(self, n: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Return the last `n` entries of the hot window (all of it by default)."""
+        with self._lock:
+            entries = list(self._hot)
+        return entries if n is None else entries[-n:] if n > 0 else []
+
+    def __len__(self) -> int:
+        return len(self._hot)
+
+    # ── Segment log ──────────────────────────────────
+    def _scan_segments(self) -> List[Tuple[int, float, str]]:
+        segments = []
+        for name in os.listdir(self.log_dir):
+            if not (name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX)):
+                continue
+            try:
+                turn, timestamp = name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)].split("-", 1)
+                segments.append((int(turn), float(timestamp), os.path.join(self.log_dir, name)))
+            except ValueError:
+                continue
+        return sorted(segments)
+
+    def _last_turn(self) -> int:
+        if not self._segments:
+            return -1
+        last = -1
+        for record in self._read_segment(self._segments[-1][2]):
+            last = record.get("turn", last)
+        return last
+
+    @staticmethod
+    def _read_segment(path: str) -> Iterator[Dict[str, Any]]:
+        try:
+            with open(path, "r") as f:
+                for line in f:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        continue  # torn trailing line from a crash
+        except FileNotFoundError:
+            return
+
+    def read(self, start_turn: Optional[int] = None, end_turn: Optional[int] = None,
+             since: Optional[float] = None, until: Optional[float] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Yield logged entries with start_turn <= turn < end_turn and
+        since <= timestamp < until, in order. Any bound may be omitted.
+        """
+        with self._lock:
+            segments = list(self._segments)
+        if not segments:
+            return
+
+        # Skip whole segments that end before the requested start
+        first = 0
+        if start_turn is not None:
+            first = max(first, bisect_right([s[0] for s in segments], start_turn) - 1)
+        if since is not None:
+            first = max(first, bisect_right([s[1] for s in segments], since) - 1)
+
+        for turn, timestamp, path in segments[first:]:
+            if (end_turn is not None and turn >= end_turn) or (until is not None and timestamp >= until):
+                return
+            for record in self._read_segment(path):
+                if start_turn is not None and record["turn"] < start_turn:
+                    continue
+                if since is not None and record["timestamp"] < since:
+                    continue
+                if (end_turn is not None and record["turn"] >= end_turn) or \
+                        (until is not None and record["timestamp"] >= until):
+                    return
+                yield record
@@ -2,24 +2,32 @@ import re
 from typing import Optional
 import uuid
 
+from conversation_history import ConversationHistory
 from generate_reply import generate_reply
+from memory_index import MemoryIndex, format_memories
 from persistent_memory import PersistentMemory
 from reminder_scheduler import ReminderScheduler
 from sentiment_analyzer import analyze_tone
 
 
 class DialogueManager:
-    def __init__(self, memory_store: PersistentMemory, scheduler: ReminderScheduler):
+    def __init__(self, memory_store: PersistentMemory, scheduler: ReminderScheduler,
+                 memory_index: Optional[MemoryIndex] = None):
         self.dialogue_state = {}
         self.memory_store = memory_store
         self.scheduler = scheduler
+        self.memory_index = memory_index  # long-term recall over past exchanges
 
         # --- NEW: Rolling short-term memory for Ren's context ---
-        self.recent_memory = []
+        self.recent_memory = ConversationHistory(capacity=10)
 
     def reset_state(self):
         self.dialogue_state.clear()
 
+    def awaiting_reply(self) -> bool:
+        """True while a multi-turn flow (e.g. collecting reminder slots) waits on the user."""
+        return bool(self.dialogue_state.get("intent"))
+
     def handle_input(self, user_input: str, user_name: Optional[str] = None):
         intent, slots = self._extract_intent_and_slots(user_input)
 
@@ -116,17 +124,14 @@ class DialogueManager:
             return f"{name_prefix}Just to confirm, you want to '{task}' at {time}. Is that right? (yes/no)"
 
     def _delete_matching_reminder(self, task: Optional[str], time: Optional[str]) -> Optional[dict]:
-        reminders = self.memory_store.get_reminders()
-        for reminder in reminders:
-            if task and task.lower() in reminder.get("task", "").lower():
-                if time:
-                    if time.strip().lower() in reminder.get("time", "").lower():
-                        self.scheduler.delete_reminder_by_id(reminder["id"])
-                        return reminder
-                else:
-                    self.scheduler.delete_reminder_by_id(reminder["id"])
-                    return reminder
-        return None
+        if not task:
+            return None
+        matches = self.memory_store.find_reminders(task=task, time=time)
+        if not matches:
+            return None
+        reminder = matches[0]
+        self.scheduler.delete_reminder_by_id(reminder["id"])
+        return reminder
 
     # --- NEW: Handle real-time input for Jarvis-style streaming ---
     def handle_partial_transcription(self, partial_text: str, user_name: Optional[str] = None):
@@ -138,8 +143,12 @@ class DialogueManager:
 
         tone = analyze_tone(partial_text)
         memory_context = "\n".join(
-            [f"User: {m['user']}\nRen: {m['ren']}" for m in self.recent_memory[-5:]]
+            [f"User: {m['user']}\nRen: {m['ren']}" for m in self.recent_memory.recent(5)]
         )
+        if self.memory_index is not None:
+            recalled = format_memories(self.memory_index.search(partial_text))
+            if recalled:
+                memory_context = f"{memory_context}\nRelated memories:\n{recalled}".strip()
 
         ren_reply = generate_reply(
             user_input=partial_text,
@@ -153,9 +162,8 @@ class DialogueManager:
             "ren": ren_reply,
             "tone": tone.get("tone", "neutral")
         })
-
-        if len(self.recent_memory) > 10:
-            self.recent_memory.pop(0)
+        if self.memory_index is not None:
+            self.memory_index.add(f"User: {partial_text}\nRen: {ren_reply}")
 
         print(f"[Ren] {ren_reply}")
         return ren_reply
\ No newline at end of file
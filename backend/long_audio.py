@@ -0,0 +1,65 @@
+# long_audio.py
+# Long recordings: split at silence, transcribe the pieces in parallel, stitch the results back together
+
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from config import config
+from transcription import SAMPLE_RATE, TranscriptionBackend
+
+FRAME_SAMPLES = SAMPLE_RATE // 50  # 20 ms energy frames
+
+def split_at_silence(audio: np.ndarray, chunk_seconds: Optional[float] = None,
+                     min_silence_ms: Optional[int] = None) -> List[Tuple[int, int]]:
+    """
+    Cut `audio` into consecutive (start, end) sample ranges of at most
+    `chunk_seconds`, each ending in the quietest `min_silence_ms` stretch of
+    its second half, so words are not split between chunks.
+    """
+    chunk = int((chunk_seconds or config.TRANSCRIBE_CHUNK_SECONDS) * SAMPLE_RATE) // FRAME_SAMPLES
+    span = max(1, (min_silence_ms or config.TRANSCRIBE_MIN_SILENCE_MS) * SAMPLE_RATE // 1000 // FRAME_SAMPLES)
+    frames = len(audio) // FRAME_SAMPLES
+    if frames <= chunk:
+        return [(0, len(audio))]
+
+    energy = np.square(audio[:frames * FRAME_SAMPLES].reshape(frames, FRAME_SAMPLES)).mean(axis=1)
+    # Mean energy of the `span` frames starting at each frame
+    window = np.convolve(energy, np.ones(span) / span, mode="valid")
+
+    bounds, start = [], 0
+    while frames - start > chunk:
+        lo, hi = start + chunk // 2, min(start + chunk - span, len(window) - 1)
+        quietest = lo + int(np.argmin(window[lo:hi + 1])) if hi >= lo else start + chunk
+        cut = min(quietest + span // 2, start + chunk)  # middle of the pause, never past the chunk limit
+        bounds.append((start * FRAME_SAMPLES, cut * FRAME_SAMPLES))
+        start = cut
+    bounds.append((start * FRAME_SAMPLES, len(audio)))
+    return bounds
+
+def transcribe_long(model: TranscriptionBackend, audio: np.ndarray, language: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Transcribe a long recording chunk by chunk. With a TranscriptionPool the
+    chunks run in parallel across its workers; any other backend takes them
+    in turn. Segment timestamps are shifted back onto the whole recording.
+    """
+    bounds = split_at_silence(audio)
+    chunks = [audio[start:end] for start, end in bounds]
+    if hasattr(model, "map"):
+        results = model.map(chunks, language=language)
+    else:
+        results = [model.transcribe(chunk, language=language) for chunk in chunks]
+
+    segments: List[Dict[str, Any]] = []
+    for (start, _), result in zip(bounds, results):
+        offset = start / SAMPLE_RATE
+        segments.extend(
+            {"start": round(s["start"] + offset, 3), "end": round(s["end"] + offset, 3), "text": s["text"]}
+            for s in result.get("segments", [])
+        )
+    return {
+        "text": " ".join(r["text"].strip() for r in results if r.get("text", "").strip()),
+        "segments": segments,
+        "language": next((r.get("language") for r in results if r.get("language")), language),
+        "chunks": len(chunks),
+    }
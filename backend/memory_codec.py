@@ -0,0 +1,70 @@
+# memory_codec.py
+# Pluggable serializers for PersistentMemory snapshots, auto-detected on load
+
+import json
+import zlib
+from typing import Any
+
+try:
+    import orjson
+except ImportError:  # optional: falls back to the stdlib json codec
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # optional: only needed for the msgpack codecs
+    msgpack = None
+
+# Binary snapshots start with MAGIC + one codec byte; anything else is JSON text
+MAGIC = b"RENM"
+MSGPACK = b"m"
+MSGPACK_ZLIB = b"z"
+
+CODECS = ("json", "orjson", "msgpack", "msgpack+zlib")
+
+def available_codecs() -> list:
+    codecs = ["json"]
+    if orjson is not None:
+        codecs.append("orjson")
+    if msgpack is not None:
+        codecs += ["msgpack", "msgpack+zlib"]
+    return codecs
+
+def resolve_codec(name: str) -> str:
+    """Return `name` if its library is installed, else the closest available codec."""
+    name = (name or "json").lower()
+    if name not in CODECS:
+        raise ValueError(f"Unknown memory codec '{name}', expected one of {CODECS}")
+    if name.startswith("msgpack") and msgpack is None:
+        print(f"[MemoryCodec] msgpack not installed, using {'orjson' if orjson else 'json'} instead of {name}")
+        name = "orjson"
+    if name == "orjson" and orjson is None:
+        name = "json"
+    return name
+
+def encode(data: Any, codec: str = "json") -> bytes:
+    if codec == "json":
+        return json.dumps(data, indent=2).encode("utf-8")
+    if codec == "orjson":
+        return orjson.dumps(data)
+    if codec == "msgpack":
+        return MAGIC + MSGPACK + msgpack.packb(data, use_bin_type=True)
+    if codec == "msgpack+zlib":
+        return MAGIC + MSGPACK_ZLIB + zlib.compress(msgpack.packb(data, use_bin_type=True), 1)
+    raise ValueError(f"Unknown memory codec '{codec}'")
+
+def decode(raw: bytes) -> Any:
+    """Decode a snapshot written by any codec, detecting the format from its header."""
+    if raw.startswith(MAGIC):
+        kind, body = raw[len(MAGIC):len(MAGIC) + 1], raw[len(MAGIC) + 1:]
+        if msgpack is None:
+            raise RuntimeError("Memory snapshot is msgpack-encoded but msgpack is not installed")
+        if kind == MSGPACK_ZLIB:
+            body = zlib.decompress(body)
+        elif kind != MSGPACK:
+            raise ValueError(f"Unknown memory snapshot codec byte {kind!r}")
+        return msgpack.unpackb(body, raw=False)
+    # JSON text from either json codec; orjson parses both and is much faster
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw.decode("utf-8"))
@@ -0,0 +1,251 @@
+# memory_index.py
+# Local vector index over past exchanges for long-term memory recall
+
+from collections import deque
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from config import config
+from model_loader import ModelNotReady, models, tensor_bytes
+
+logger = logging.getLogger(__name__)
+
+EmbedFn = Callable[[List[str]], np.ndarray]
+
+HNSW_BATCH = 5000  # stays under chromadb's maximum batch size
+DEFERRED_MAX = 256  # exchanges held back while the shared encoder is loading
+
+def load_embedder(model_name: str) -> EmbedFn:
+    """Load a small transformer encoder and return a mean-pooled sentence embedding function."""
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModel.from_pretrained(model_name).eval()
+
+    def embed(texts: List[str]) -> np.ndarray:
+        inputs = tokenizer(texts, padding=True, truncation=True, max_length=256, return_tensors="pt")
+        with torch.no_grad():
+            hidden = model(**inputs).last_hidden_state
+        mask = inputs["attention_mask"].unsqueeze(-1).float()
+        pooled = (hidden * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1e-9)
+        return pooled.numpy().astype(np.float32)
+
+    embed.memory_bytes = lambda: tensor_bytes(model)
+    return embed
+
+# One shared encoder for every user's index, owned by the model registry; only
+# registered (and so preloaded, awaited by /ready and budgeted) when recall is on
+if config.LONG_TERM_MEMORY:
+    models.register("embedding", lambda: load_embedder(config.EMBEDDING_MODEL),
+                    warmup=lambda embed: embed(["Hello, Ren."]), size=config.EMBEDDING_MODEL)
+
+class MemoryIndex:
+    """
+    Cosine-similarity index over remembered exchanges.
+
+    Embeddings are L2-normalized and kept in one contiguous float32 matrix, so a
+    brute-force search is a single matrix-vector product plus a partial sort.
+    Each new memory is embedded once and appended to `vectors.f32` /
+    `entries.jsonl`, so restarts reload the cache instead of re-embedding history.
+
+    Brute force is memory-bandwidth bound (about 150 MB per query at 100k
+    memories), so with `hnsw=True` the same vectors are also mirrored into a
+    chromadb HNSW collection, which serves searches once the index holds at
+    least config.MEMORY_INDEX_HNSW_MIN memories.
+    """
+
+    def __init__(self, index_dir: str, model_name: Optional[str] = None, embed_fn: Optional[EmbedFn] = None,
+                 hnsw: Optional[bool] = None):
+        self.index_dir = index_dir
+        self.model_name = model_name or config.EMBEDDING_MODEL
+        self._embed_fn = embed_fn
+        self._lock = threading.Lock()
+        self._vectors: Optional[np.ndarray] = None  # preallocated, first `_count` rows in use
+        self._entries: List[Dict[str, Any]] = []
+        self._count = 0
+        self._deferred: Deque[Tuple[str, Dict[str, Any]]] = deque(maxlen=DEFERRED_MAX)
+        self.disabled = False
+
+        os.makedirs(index_dir, exist_ok=True)
+        self._vectors_path = os.path.join(index_dir, "vectors.f32")
+        self._entries_path = os.path.join(index_dir, "entries.jsonl")
+        self._meta_path = os.path.join(index_dir, "meta.json")
+        self._load()
+
+        self._hnsw = None
+        if config.MEMORY_INDEX_HNSW if hnsw is None else hnsw:
+            self._hnsw = self._open_hnsw()
+
+    # ── HNSW mirror ──────────────────────────────────
+    def _open_hnsw(self):
+        try:
+            import chromadb
+        except ImportError:
+            logger.warning("[MemoryIndex] chromadb not installed; using brute-force search")
+            return None
+        try:
+            client = chromadb.PersistentClient(path=os.path.join(self.index_dir, "hnsw"))
+            collection = client.get_or_create_collection("memories", metadata={"hnsw:space": "cosine"})
+            # Backfill rows cached before the mirror existed (or lost with it)
+            start = collection.count()
+            if start > self._count:
+                client.delete_collection("memories")
+                collection = client.create_collection("memories", metadata={"hnsw:space": "cosine"})
+                start = 0
+            for offset in range(start, self._count, HNSW_BATCH):
+                end = min(offset + HNSW_BATCH, self._count)
+                collection.add(ids=[str(i) for i in range(offset, end)], embeddings=self._vectors[offset:end])
+            return collection
+        except Exception as e:
+            logger.error(f"[MemoryIndex] Could not open HNSW index: {e}")
+            return None
+
+    # ── Embedding ────────────────────────────────────
+    def _embed(self, texts: List[str]) -> Optional[np.ndarray]:
+        if self.disabled:
+            return None
+        embed_fn = self._embed_fn
+        if embed_fn is None and self.model_name == config.EMBEDDING_MODEL and config.LONG_TERM_MEMORY:
+            # The shared encoder is looked up on every call rather than kept, so the
+            # registry can unload it when idle. Never wait for it on a request thread:
+            # while it (re)loads, recall is skipped and new memories are deferred.
+            try:
+                embed_fn = models.get("embedding")
+            except ModelNotReady:
+                return None
+        elif embed_fn is None:
+            try:
+                embed_fn = self._embed_fn = load_embedder(self.model_name)
+            except Exception as e:
+                logger.error(f"[MemoryIndex] Could not load embedding model {self.model_name}: {e}")
+                self.disabled = True
+                return None
+        try:
+            vectors = np.asarray(embed_fn(texts), dtype=np.float32)
+        except Exception as e:
+            logger.error(f"[MemoryIndex] Embedding failed: {e}")
+            return None
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    # ── Persistence ──────────────────────────────────
+    def _load(self) -> None:
+        if not os.path.exists(self._meta_path):
+            return
+        try:
+            with open(self._meta_path, "r") as f:
+                meta = json.load(f)
+            if meta.get("model") != self.model_name:
+                logger.warning(f"[MemoryIndex] Index was built with {meta.get('model')}; starting a new one")
+                for path in (self._vectors_path, self._entries_path, self._meta_path):
+                    if os.path.exists(path):
+                        os.remove(path)
+                return
+            vectors = np.fromfile(self._vectors_path, dtype=np.float32).reshape(-1, meta["dim"])
+            with open(self._entries_path, "r") as f:
+                entries = [json.loads(line) for line in f if line.strip()]
+        except Exception as e:
+            logger.error(f"[MemoryIndex] Error loading index: {e}")
+            return
+        # A crash between the two appends can leave one file a row ahead
+        count = min(len(vectors), len(entries))
+        self._vectors = np.array(vectors[:count])
+        self._entries = entries[:count]
+        self._count = count
+
+    def _persist(self, vectors: np.ndarray, entries: List[Dict[str, Any]]) -> None:
+        try:
+            if not os.path.exists(self._meta_path):
+                with open(self._meta_path, "w") as f:
+                    json.dump({"model": self.model_name, "dim": int(vectors.shape[1])}, f)
+            with open(self._vectors_path, "ab") as f:
+                f.write(vectors.tobytes())
+            with open(self._entries_path, "a") as f:
+                f.write("".join(json.dumps(entry) + "\n" for entry in entries))
+        except Exception as e:
+            logger.error(f"[MemoryIndex] Error persisting memories: {e}")
+
+    # ── Index API ────────────────────────────────────
+    def add(self, text: str, **metadata: Any) -> None:
+        """Embed and remember one exchange."""
+        self.add_many([text], [metadata])
+
+    def add_many(self, texts: List[str], metadata: Optional[List[Dict[str, Any]]] = None) -> None:
+        pairs = [(t, {"timestamp": time.time(), **m}) for t, m in zip(texts, metadata or [{} for _ in texts])
+                 if t and t.strip()]
+        if not pairs:
+            return
+        with self._lock:
+            pairs = list(self._deferred) + pairs
+            self._deferred.clear()
+        vectors = self._embed([text for text, _ in pairs])
+        if vectors is None:
+            if not self.disabled:
+                # Encoder still loading: keep the newest exchanges and index them with the next add
+                with self._lock:
+                    self._deferred.extend(pairs)
+            return
+        entries = [{"text": text, **meta} for text, meta in pairs]
+
+        with self._lock:
+            needed = self._count + len(entries)
+            if self._vectors is None or needed > len(self._vectors):
+                # Grow geometrically so appends stay amortized O(1)
+                capacity = max(needed, 2 * (len(self._vectors) if self._vectors is not None else 256))
+                grown = np.empty((capacity, vectors.shape[1]), dtype=np.float32)
+                if self._vectors is not None:
+                    grown[:self._count] = self._vectors[:self._count]
+                self._vectors = grown
+            self._vectors[self._count:needed] = vectors
+            self._entries.extend(entries)
+            first = self._count
+            self._count = needed
+            self._persist(vectors, entries)
+            if self._hnsw is not None:
+                try:
+                    self._hnsw.add(ids=[str(i) for i in range(first, needed)], embeddings=vectors)
+                except Exception as e:
+                    logger.error(f"[MemoryIndex] HNSW insert failed, falling back to brute force: {e}")
+                    self._hnsw = None
+
+    def search(self, query: str, k: Optional[int] = None, min_score: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Return up to `k` remembered entries most similar to `query`, best first, each with a `score`."""
+        k = k or config.MEMORY_RECALL_K
+        min_score = config.MEMORY_RECALL_MIN_SCORE if min_score is None else min_score
+        if self._count == 0 or not query.strip():
+            return []
+        query_vector = self._embed([query])
+        if query_vector is None:
+            return []
+
+        if self._hnsw is not None and self._count >= config.MEMORY_INDEX_HNSW_MIN:
+            try:
+                result = self._hnsw.query(query_embeddings=query_vector, n_results=min(k, self._count),
+                                          include=["distances"])
+                hits = [(int(i), 1.0 - d) for i, d in zip(result["ids"][0], result["distances"][0])]
+                return [{**self._entries[i], "score": float(score)} for i, score in hits if score >= min_score]
+            except Exception as e:
+                logger.error(f"[MemoryIndex] HNSW search failed, using brute force: {e}")
+
+        with self._lock:
+            count = self._count
+            scores = self._vectors[:count] @ query_vector[0]
+            entries = self._entries  # append-only, so the first `count` rows are stable
+        k = min(k, count)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [{**entries[i], "score": float(scores[i])} for i in top if scores[i] >= min_score]
+
+    def __len__(self) -> int:
+        return self._count
+
+def format_memories(results: List[Dict[str, Any]]) -> str:
+    """Render recalled memories for the prompt's memory section."""
+    return "\n".join(f"- {r['text']}" for r in results)
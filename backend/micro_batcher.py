@@ -0,0 +1,115 @@
+# micro_batcher.py
+# Collects concurrent single-item requests into batches for one model call
+
+from concurrent.futures import Future
+import queue
+import threading
+import time
+from typing import Callable, Generic, List, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+class MicroBatcher(Generic[T, R]):
+    """
+    Queue in front of a batched function.
+
+    Callers `submit` one item and get a Future back. A single worker thread
+    takes the first queued item, keeps collecting for up to `max_wait_ms` or
+    until `max_batch_size` items are waiting, calls `process_batch(items)` once
+    and resolves every caller's future with its own result. Under load batches
+    fill immediately, so the wait only costs latency when traffic is light.
+    """
+
+    def __init__(self, process_batch: Callable[[List[T]], List[R]], max_batch_size: int = 16,
+                 max_wait_ms: float = 5.0, name: str = "MicroBatcher"):
+        self.process_batch = process_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self.name = name
+        self._queue: "queue.Queue[Optional[Tuple[T, Future]]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker: Optional[threading.Thread] = None
+        self._closed = False
+        self.batches = 0
+        self.items = 0
+        self.max_seen_batch = 0
+
+    # ── Submitting ───────────────────────────────────
+    def submit(self, item: T) -> "Future[R]":
+        future: "Future[R]" = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError(f"{self.name} is closed")
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._worker.start()
+            self._queue.put((item, future))
+        return future
+
+    def run(self, item: T, timeout: Optional[float] = None) -> R:
+        """Submit one item and block until its result is ready."""
+        return self.submit(item).result(timeout)
+
+    # ── Worker ───────────────────────────────────────
+    def _collect(self) -> Optional[List[Tuple[T, Future]]]:
+        first = self._queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                entry = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if entry is None:
+                self._queue.put(None)  # finish this batch, then stop
+                break
+            batch.append(entry)
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            # Drop callers that gave up (cancelled) before the batch ran
+            batch = [(item, future) for item, future in batch if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            try:
+                results = self.process_batch([item for item, _ in batch])
+                if len(results) != len(batch):
+                    raise RuntimeError(f"batch function returned {len(results)} results for {len(batch)} items")
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            self.batches += 1
+            self.items += len(batch)
+            self.max_seen_batch = max(self.max_seen_batch, len(batch))
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+
+    # ── Lifecycle ────────────────────────────────────
+    def close(self, timeout: Optional[float] = None) -> None:
+        """Stop accepting work; items already queued are still processed."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            worker = self._worker
+            self._queue.put(None)
+        if worker is not None:
+            worker.join(timeout)
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+            "max_batch_size": self.max_seen_batch,
+            "queue_depth": self._queue.qsize(),
+        }
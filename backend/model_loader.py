@@ -0,0 +1,264 @@
+# model_loader.py
+# Registry that owns every model: loads them on background threads, warms them up,
+# tracks readiness and memory, and unloads idle ones when over the RAM budget
+
+from contextlib import contextmanager
+import gc
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Union
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+def tensor_bytes(module: Any) -> int:
+    """Bytes held by a torch module's parameters and buffers."""
+    tensors = list(module.parameters()) + list(module.buffers())
+    return sum(t.numel() * t.element_size() for t in tensors)
+
+def rss_bytes(pid: Union[int, str] = "self") -> Optional[int]:
+    """Resident set size of a process (this one by default); None where /proc isn't available."""
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return None
+
+class ModelNotReady(RuntimeError):
+    """Raised when a model is requested before it has finished loading and warming up."""
+
+    def __init__(self, name: str, state: str, retry_after: int):
+        super().__init__(f"Model '{name}' is not ready yet ({state})")
+        self.name = name
+        self.state = state
+        self.retry_after = retry_after
+
+class ModelLoader:
+    """
+    Registry of lazily loaded models.
+
+    `register(name, load, warmup, size)` declares a model without loading it;
+    there is one shared instance per name per process. `start()` loads every
+    registered model on its own thread, then runs `warmup(model)` on a dummy
+    input; only after warm-up is the model handed out. `get(name)` never
+    blocks: it raises ModelNotReady (and kicks off loading if nothing has
+    started it yet) until the model is ready, while `wait(name)` blocks for
+    callers that have nothing better to do.
+
+    Each model's memory is its own `memory_bytes()` when it has one (tensor
+    byte counts, or worker process RSS for models living in other processes).
+    Otherwise it falls back to the growth in this process's resident memory
+    while `load()` ran; loads run in parallel, so that figure is approximate
+    and can include allocations made by other models loading at the same time.
+    With a budget set, models idle for `idle_seconds` are unloaded, least
+    recently used first, until the total fits; the next `get` reloads them.
+
+    `get` is for a single call. Callers that hold a model across many calls
+    (a streaming session, the chunks of a long upload) `acquire` it, or use
+    `lease`, and `release` it when done: a leased model is never unloaded,
+    and releasing it counts as its last use.
+    """
+
+    def __init__(self, retry_after: Optional[int] = None, budget_mb: Optional[float] = None,
+                 idle_seconds: Optional[float] = None):
+        self.retry_after = retry_after or config.MODEL_RETRY_AFTER
+        self.budget_bytes = int((config.MODEL_MEMORY_BUDGET_MB if budget_mb is None else budget_mb) * 1024 * 1024)
+        self.idle_seconds = config.MODEL_IDLE_SECONDS if idle_seconds is None else idle_seconds
+        self._specs: Dict[str, tuple] = {}
+        self._models: Dict[str, Any] = {}
+        self._status: Dict[str, Dict[str, Any]] = {}
+        self._ready: Dict[str, threading.Event] = {}
+        self._lock = threading.Lock()
+        self._sweeper: Optional[threading.Thread] = None
+
+    def register(self, name: str, load: Callable[[], Any], warmup: Optional[Callable[[Any], Any]] = None,
+                 size: Optional[str] = None) -> None:
+        with self._lock:
+            self._specs[name] = (load, warmup)
+            self._status[name] = {"state": "pending", "size": size, "load_seconds": None, "warmup_seconds": None,
+                                  "loaded_at": None, "last_used": None, "leases": 0, "memory_bytes": None, "unloads": 0,
+                                  "error": None, "failed_at": None}
+            self._ready[name] = threading.Event()
+
+    # ── Loading ──────────────────────────────────────
+    def start(self, names: Optional[Iterable[str]] = None) -> None:
+        """Start loading the named models (all registered ones by default) in the background."""
+        with self._lock:
+            names = list(self._specs) if names is None else list(names)
+            to_load = [name for name in names if self._status[name]["state"] in ("pending", "failed", "unloaded")]
+            for name in to_load:
+                self._status[name].update(state="loading", error=None)
+                self._ready[name].clear()
+            if self.budget_bytes and to_load and self._sweeper is None:
+                self._sweeper = threading.Thread(target=self._sweep, name="model-sweeper", daemon=True)
+                self._sweeper.start()
+        for name in to_load:
+            threading.Thread(target=self._load, args=(name,), name=f"load-{name}", daemon=True).start()
+
+    def _load(self, name: str) -> None:
+        load, warmup = self._specs[name]
+        status = self._status[name]
+        try:
+            before = rss_bytes()
+            start = time.perf_counter()
+            model = load()
+            status["load_seconds"] = round(time.perf_counter() - start, 3)
+            after = rss_bytes()
+            if before is not None and after is not None:
+                status["memory_bytes"] = max(0, after - before)
+            if warmup is not None:
+                status["state"] = "warming"
+                start = time.perf_counter()
+                warmup(model)
+                status["warmup_seconds"] = round(time.perf_counter() - start, 3)
+        except Exception as e:
+            logger.error(f"[ModelLoader] Failed to load {name}: {e}")
+            status.update(state="failed", error=str(e), failed_at=time.time())
+            self._ready[name].set()  # wake waiters so they see the failure
+            return
+        with self._lock:
+            self._models[name] = model
+            status.update(state="ready", failed_at=None, loaded_at=time.time(), last_used=time.time())
+        if self.budget_bytes:
+            self.enforce_budget(keep=name)  # make room before anyone waiting on `name` proceeds
+        self._ready[name].set()
+        logger.info(f"[ModelLoader] {name} ready (load {status['load_seconds']}s, warm-up {status['warmup_seconds']}s)")
+
+    # ── Memory budget ────────────────────────────────
+    def memory_bytes(self, name: str) -> Optional[int]:
+        """Current memory of a loaded model; None when unknown or not loaded."""
+        model = self._models.get(name)
+        if model is None:
+            return None
+        if hasattr(model, "memory_bytes"):
+            return model.memory_bytes()
+        return self._status[name]["memory_bytes"]
+
+    def unload(self, name: str) -> bool:
+        """Drop a loaded model (closing it if it can be); it is reloaded on next use."""
+        with self._lock:
+            if self._status[name]["leases"]:
+                return False  # in use; unloading would close it underneath its callers
+            model = self._models.pop(name, None)
+            if model is None:
+                return False
+            self._status[name].update(state="unloaded", unloads=self._status[name]["unloads"] + 1)
+            self._ready[name].clear()
+        if hasattr(model, "close"):
+            model.close()
+        del model
+        gc.collect()
+        logger.info(f"[ModelLoader] Unloaded idle model {name}")
+        return True
+
+    def enforce_budget(self, keep: Optional[str] = None) -> List[str]:
+        """Unload models idle for `idle_seconds`, least recently used first, until the total fits the budget."""
+        if not self.budget_bytes:
+            return []
+        sizes = {name: self.memory_bytes(name) or 0 for name in list(self._models)}
+        total = sum(sizes.values())
+        now = time.time()
+        idle = sorted(
+            (name for name in sizes
+             if name != keep and not self._status[name]["leases"]
+             and now - (self._status[name]["last_used"] or 0) >= self.idle_seconds),
+            key=lambda name: self._status[name]["last_used"] or 0,
+        )
+        unloaded = []
+        for name in idle:
+            if total <= self.budget_bytes:
+                break
+            if self.unload(name):
+                total -= sizes[name]
+                unloaded.append(name)
+        return unloaded
+
+    def _sweep(self) -> None:
+        while True:
+            time.sleep(max(1.0, min(60.0, self.idle_seconds / 2)))
+            try:
+                self.enforce_budget()
+            except Exception as e:
+                logger.error(f"[ModelLoader] Budget check failed: {e}")
+
+    # ── Access ───────────────────────────────────────
+    def get(self, name: str) -> Any:
+        model = self._models.get(name)
+        if model is not None:
+            self._status[name]["last_used"] = time.time()
+            return model
+        if name not in self._specs:
+            raise KeyError(f"Unknown model '{name}'")
+        status = self._status[name]
+        # Start a model nobody has loaded yet (or that was unloaded); retry a failed one at most once per retry_after
+        if status["state"] in ("pending", "unloaded") or \
+                (status["state"] == "failed" and time.time() - status["failed_at"] >= self.retry_after):
+            self.start([name])
+        raise ModelNotReady(name, status["state"], self.retry_after)
+
+    def peek(self, name: str) -> Optional[Any]:
+        """The loaded model, or None; unlike `get` it neither loads it nor counts as a use."""
+        return self._models.get(name)
+
+    def acquire(self, name: str, wait: bool = False, timeout: Optional[float] = None) -> Any:
+        """Like `get` (or `wait` with `wait=True`), but the model stays loaded until `release(name)`."""
+        while True:
+            with self._lock:
+                model = self._models.get(name)
+                if model is not None:
+                    status = self._status[name]
+                    status.update(leases=status["leases"] + 1, last_used=time.time())
+                    return model
+            # Not loaded: raise ModelNotReady, or block until it is and take the lease on the next pass
+            if wait:
+                self.wait(name, timeout)
+            else:
+                self.get(name)
+
+    def release(self, name: str) -> None:
+        with self._lock:
+            status = self._status[name]
+            status.update(leases=max(0, status["leases"] - 1), last_used=time.time())
+
+    @contextmanager
+    def lease(self, name: str, wait: bool = False, timeout: Optional[float] = None) -> Iterator[Any]:
+        """`with models.lease("whisper") as model:` holds the model for the block."""
+        model = self.acquire(name, wait=wait, timeout=timeout)
+        try:
+            yield model
+        finally:
+            self.release(name)
+
+    def wait(self, name: str, timeout: Optional[float] = None) -> Any:
+        """Block until `name` is ready (loading it if needed); raises ModelNotReady on timeout or failure."""
+        if name not in self._specs:
+            raise KeyError(f"Unknown model '{name}'")
+        self.start([name])
+        self._ready[name].wait(timeout)
+        return self.get(name)
+
+    def is_ready(self, name: str) -> bool:
+        return name in self._models
+
+    def status(self) -> dict:
+        with self._lock:
+            models = {name: dict(status) for name, status in self._status.items()}
+        for name, status in models.items():
+            status["memory_bytes"] = self.memory_bytes(name)
+        return {
+            "ready": all(s["state"] in ("ready", "unloaded") for s in models.values()),
+            "models": models,
+            "memory": {
+                "process_rss_bytes": rss_bytes(),
+                "models_bytes": sum(s["memory_bytes"] or 0 for s in models.values()),
+                "budget_bytes": self.budget_bytes or None,
+            },
+        }
+
+# Shared registry; model modules register themselves on import
+models = ModelLoader()
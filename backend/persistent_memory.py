@@ -1,59 +1,353 @@
 # persistent_memory.py
 
+import atexit
 import json
 import os
-from typing import Any, Dict
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from config import config
+from memory_codec import decode, encode, resolve_codec
 
 MEMORY_FILE = "ren_memory.json"
+JOURNAL_SUFFIX = ".journal"
+
+REMINDER_TIME_FORMATS = ("%I:%M%p", "%I%p", "%H:%M")
+
+def normalize_time(time_str: str) -> str:
+    """Normalize a reminder time like '10:30 pm' to 24-hour 'HH:MM' ('' if unparseable)."""
+    try:
+        cleaned = time_str.strip().upper().replace(" ", "")
+    except AttributeError:
+        return ""
+    for fmt in REMINDER_TIME_FORMATS:
+        try:
+            return datetime.strptime(cleaned, fmt).strftime("%H:%M")
+        except ValueError:
+            continue
+    return ""
+
+class FrozenDict(dict):
+    """A dict that refuses mutation; snapshot values are shared between threads without copying."""
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("memory snapshots are read-only; write through PersistentMemory instead")
+
+    __setitem__ = __delitem__ = __ior__ = _readonly
+    clear = pop = popitem = setdefault = update = _readonly
+
+    def __reduce__(self):
+        return FrozenDict, (dict(self),)
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+def freeze(value: Any) -> Any:
+    """Deep-convert dicts to FrozenDict and lists to tuples."""
+    if isinstance(value, FrozenDict):
+        return value
+    if isinstance(value, dict):
+        return FrozenDict((k, freeze(v)) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(v) for v in value)
+    return value
+
+def create_memory_store(backend: Optional[str] = None, user_id: Optional[str] = None) -> "PersistentMemory":
+    """
+    Build the memory store selected by config.MEMORY_BACKEND ('json' or 'sqlite').
+    With a `user_id` the store is that user's own shard under config.MEMORY_USER_DIR.
+    """
+    backend = (backend or config.MEMORY_BACKEND).lower()
+    if user_id:
+        from user_memory import shard_path
+        if backend == "sqlite":
+            from sqlite_memory import SQLiteMemory
+            return SQLiteMemory(shard_path(user_id, extension=".db"))
+        return PersistentMemory(shard_path(user_id))
+    if backend == "sqlite":
+        from sqlite_memory import SQLiteMemory
+        return SQLiteMemory(config.MEMORY_DB_FILE, migrate_from=MEMORY_FILE)
+    return PersistentMemory()
 
 class PersistentMemory:
-    def __init__(self, file_path: str = MEMORY_FILE):
+    def __init__(self, file_path: str = MEMORY_FILE, journal: bool = None, compact_every: int = None,
+                 flush_interval_ms: int = None, codec: str = None):
         self.file_path = file_path
+        # Snapshot format for writes; reads detect whichever format the file is in
+        self.codec = resolve_codec(codec or config.MEMORY_CODEC)
+        self.journal_path = file_path + JOURNAL_SUFFIX
+        # Journal mode appends one small record per mutation instead of rewriting
+        # the whole file; the log is folded into the snapshot every `compact_every` records.
+        self.journal = config.MEMORY_JOURNAL if journal is None else journal
+        self.compact_every = compact_every or config.MEMORY_COMPACT_EVERY
+        # With a flush interval, mutations only mark the store dirty and a background
+        # thread writes them out at most once per interval. 0 writes synchronously.
+        self.flush_interval_ms = config.MEMORY_FLUSH_INTERVAL_MS if flush_interval_ms is None else flush_interval_ms
+        self._journal_entries = 0
+        self._lock = threading.RLock()
+        self._write_lock = threading.RLock()  # keeps disk writes in order; always taken before _lock
+        self._pending: List[Dict[str, Any]] = []
+        self._dirty = threading.Event()
+        self._closed = False
+        # `memory` is an immutable snapshot that is swapped, never mutated, on each
+        # commit; readers take the current reference without locking.
+        self.version = 0
         self.memory: Dict[str, Any] = self._load_memory()
+        self._snapshot = (self.version, self.memory)
+
+        self._flusher: Optional[threading.Thread] = None
+        if self.flush_interval_ms > 0:
+            self._flusher = threading.Thread(target=self._flush_loop, daemon=True)
+            self._flusher.start()
+            atexit.register(self.close)
 
     def _load_memory(self) -> Dict[str, Any]:
+        memory: Dict[str, Any] = {}
         if os.path.exists(self.file_path):
             try:
-                with open(self.file_path, "r") as f:
-                    return json.load(f)
+                with open(self.file_path, "rb") as f:
+                    memory = decode(f.read())
             except Exception as e:
                 print(f"[PersistentMemory] Error loading memory: {e}")
-        return {}
+        memory = dict(memory)
+        self._replay_journal(memory)
+        return freeze(memory)
 
-    def save(self) -> None:
+    def _replay_journal(self, memory: Dict[str, Any]) -> None:
+        if not os.path.exists(self.journal_path):
+            return
         try:
-            with open(self.file_path, "w") as f:
-                json.dump(self.memory, f, indent=2)
+            with open(self.journal_path, "r") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # A torn trailing write from a crash; everything before it is intact.
+                        print("[PersistentMemory] Skipping corrupt journal record")
+                        continue
+                    self._apply(memory, record, replaying=True)
+                    self._journal_entries += 1
         except Exception as e:
-            print(f"[PersistentMemory] Error saving memory: {e}")
+            print(f"[PersistentMemory] Error replaying journal: {e}")
+
+    @staticmethod
+    def _apply(memory: Dict[str, Any], record: Dict[str, Any], replaying: bool = False) -> None:
+        """
+        Apply one mutation record to the working top-level dict `memory`. Nested
+        values are replaced, never modified, so published snapshots stay intact.
+        """
+        op = record.get("op")
+        reminders = memory.get("reminders", ())
+        if op == "set":
+            memory[record["key"]] = freeze(record["value"])
+        elif op == "delete":
+            memory.pop(record["key"], None)
+        elif op == "add_reminder":
+            reminder = freeze(record["reminder"])
+            # Replay is idempotent so a journal left over from an interrupted
+            # compaction doesn't duplicate reminders already in the snapshot
+            if not (replaying and any(r.get("id") == reminder.get("id") for r in reminders)):
+                memory["reminders"] = tuple(reminders) + (reminder,)
+        elif op == "delete_reminder":
+            memory["reminders"] = tuple(r for r in reminders if r.get("id") != record["id"])
+        elif op == "update_reminder":
+            memory["reminders"] = tuple(
+                freeze({**r, **record["fields"]}) if r.get("id") == record["id"] else r for r in reminders
+            )
+        elif op == "reminder_batch":
+            deleted = set(record.get("delete", []))
+            updates = record.get("update", {})
+            kept = [
+                freeze({**r, **updates[r["id"]]}) if r.get("id") in updates else r
+                for r in reminders if r.get("id") not in deleted
+            ]
+            existing = {r.get("id") for r in kept} if replaying else set()
+            kept.extend(freeze(r) for r in record.get("add", []) if r.get("id") not in existing)
+            memory["reminders"] = tuple(kept)
+
+    def _commit(self, record: Dict[str, Any]) -> None:
+        # The single serialized write path: copy the top level, apply, publish
+        with self._lock:
+            working = dict(self.memory)
+            self._apply(working, record)
+            self.memory = FrozenDict(working)
+            self.version += 1
+            self._snapshot = (self.version, self.memory)
+            self._pending.append(record)
+        if self._flusher is not None and not self._closed:
+            self._dirty.set()
+        else:
+            self.flush()
+
+    def _flush_loop(self) -> None:
+        while not self._closed:
+            self._dirty.wait()
+            # Let further mutations within the interval coalesce into this write
+            time.sleep(self.flush_interval_ms / 1000)
+            self.flush()
+
+    def flush(self) -> None:
+        """Write out every pending mutation now."""
+        with self._write_lock:
+            records, _ = self._take_pending()
+            if not records:
+                return
+            if not self.journal:
+                self.save()
+                return
+            try:
+                with open(self.journal_path, "a") as f:
+                    f.write("".join(json.dumps(record) + "\n" for record in records))
+                self._journal_entries += len(records)
+            except Exception as e:
+                print(f"[PersistentMemory] Error writing journal: {e}")
+                self.compact()
+                return
+            if self._journal_entries >= self.compact_every:
+                self.compact()
+
+    def _take_pending(self) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        # Only this swap holds the commit lock; encoding and fsync happen after it is
+        # released, so mutations never wait on the disk. The returned memory already
+        # includes every record taken, so a snapshot of it makes them durable.
+        with self._lock:
+            self._dirty.clear()
+            records, self._pending = self._pending, []
+            return records, self.memory
+
+    def close(self) -> None:
+        """Stop the background flusher and write out anything pending."""
+        self._closed = True
+        self._dirty.set()
+        self.flush()
+        # Evicted per-user stores would otherwise stay referenced by atexit until shutdown
+        atexit.unregister(self.close)
+
+    def _write_snapshot(self, memory: Dict[str, Any]) -> None:
+        data = encode(memory, self.codec)  # an immutable snapshot, safe to encode unlocked
+        # Write-then-rename so a crash mid-write never leaves a truncated memory file
+        tmp_path = self.file_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.file_path)
+
+    def compact(self) -> None:
+        """Fold the journal into a fresh snapshot and truncate the log."""
+        with self._write_lock:
+            _, memory = self._take_pending()
+            try:
+                self._write_snapshot(memory)
+                if os.path.exists(self.journal_path):
+                    os.remove(self.journal_path)
+                self._journal_entries = 0
+            except Exception as e:
+                print(f"[PersistentMemory] Error compacting memory: {e}")
+
+    def save(self) -> None:
+        if self.journal:
+            self.compact()
+            return
+        with self._write_lock:
+            _, memory = self._take_pending()
+            try:
+                self._write_snapshot(memory)
+            except Exception as e:
+                print(f"[PersistentMemory] Error saving memory: {e}")
 
     def get(self, key: str, default=None) -> Any:
         return self.memory.get(key, default)
 
+    def snapshot(self) -> Tuple[int, Dict[str, Any]]:
+        """Return (version, read-only memory) as one consistent view."""
+        return self._snapshot
+
+    def update(self, key: str, fn: Callable[[Any], Any], default=None) -> Any:
+        """Atomically replace `key` with fn(current value) and return the new value."""
+        with self._lock:
+            value = fn(self.memory.get(key, default))
+            self.set(key, value)
+            return self.memory.get(key)
+
+    def compare_and_set(self, key: str, value: Any, expected_version: int) -> bool:
+        """Set `key` only if nothing was committed since `expected_version`."""
+        with self._lock:
+            if self.version != expected_version:
+                return False
+            self.set(key, value)
+            return True
+
     def set(self, key: str, value: Any) -> None:
-        self.memory[key] = value
-        self.save()
+        self._commit({"op": "set", "key": key, "value": value})
 
     def delete(self, key: str) -> None:
         if key in self.memory:
-            del self.memory[key]
-            self.save()
+            self._commit({"op": "delete", "key": key})
 
     def all(self) -> Dict[str, Any]:
         return self.memory
     
 # Optional convenience methods
     def add_reminder(self, reminder: Dict[str, Any]) -> None:
-        reminders = self.memory.get("reminders", [])
-        reminders.append(reminder)
-        self.memory["reminders"] = reminders
-        self.save()
+        self._commit({"op": "add_reminder", "reminder": reminder})
 
     def get_reminders(self) -> list:
-        return self.memory.get("reminders", [])
+        return list(self.memory.get("reminders", ()))
+
+    def delete_reminder(self, reminder_id: str) -> bool:
+        with self._lock:
+            if not any(r.get("id") == reminder_id for r in self.memory.get("reminders", ())):
+                return False
+            self._commit({"op": "delete_reminder", "id": reminder_id})
+            return True
+
+    def update_reminder(self, reminder_id: str, **fields: Any) -> None:
+        self._commit({"op": "update_reminder", "id": reminder_id, "fields": fields})
+
+    def get_reminder(self, reminder_id: str) -> Optional[Dict[str, Any]]:
+        return next((r for r in self.get_reminders() if r.get("id") == reminder_id), None)
+
+    def batch_reminders(self, add: Optional[List[Dict[str, Any]]] = None,
+                        update: Optional[Dict[str, Dict[str, Any]]] = None,
+                        delete: Optional[List[str]] = None) -> None:
+        """Apply many reminder deletes, updates and inserts (in that order) as one write."""
+        if not (add or update or delete):
+            return
+        self._commit({"op": "reminder_batch", "add": add or [], "update": update or {}, "delete": delete or []})
+
+    def get_due_reminders(self, due_time: str, include_notified: bool = False) -> List[Dict[str, Any]]:
+        """Return reminders whose normalized time equals `due_time` ('HH:MM')."""
+        return [
+            r for r in self.get_reminders()
+            if normalize_time(r.get("time", "")) == due_time
+            and (include_notified or not r.get("notified"))
+        ]
 
-    def delete_reminder(self, reminder_id: str) -> None:
-        reminders = self.memory.get("reminders", [])
-        reminders = [r for r in reminders if r.get("id") != reminder_id]
-        self.memory["reminders"] = reminders
-        self.save()
\ No newline at end of file
+    def find_reminders(self, user: Optional[str] = None, task: Optional[str] = None,
+                       time: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Return reminders matching a user, a task substring and/or a time."""
+        wanted_time = normalize_time(time) if time else ""
+        matches = []
+        for reminder in self.get_reminders():
+            if user and reminder.get("user") != user:
+                continue
+            if task and task.lower() not in reminder.get("task", "").lower():
+                continue
+            if time:
+                reminder_time = reminder.get("time", "")
+                if wanted_time:
+                    if normalize_time(reminder_time) != wanted_time:
+                        continue
+                elif time.strip().lower() not in reminder_time.lower():
+                    continue
+            matches.append(reminder)
+        return matches
@@ -1,73 +1,233 @@
-from datetime import datetime
+from datetime import datetime, timedelta
+import heapq
+import json
 import threading
 import time
-from typing import Optional
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+import uuid
 
-from persistent_memory import PersistentMemory
+from persistent_memory import PersistentMemory, normalize_time
 
 
+def is_reminder_id(value) -> bool:
+    """Reminder ids are strings; integers are accepted and compared as strings."""
+    return (isinstance(value, str) and value != "") or (isinstance(value, int) and not isinstance(value, bool))
+
 class ReminderScheduler:
-    def __init__(self, memory: PersistentMemory, check_interval: int = 30):
+    """
+    Event-driven reminder engine.
+
+    Each reminder's time is parsed once, when it is scheduled or loaded, into an
+    absolute `due_at` timestamp kept in a min-heap. The worker thread sleeps on a
+    condition variable until the earliest due time or until a new reminder is
+    inserted, so it fires on time and uses no CPU while idle.
+    """
+
+    def __init__(self, memory: PersistentMemory, notify_callback: Optional[Callable[[str], None]] = None,
+                 remove_fired: bool = False):
         self.memory = memory
-        self.check_interval = check_interval  # in seconds
+        self.notify = notify_callback  # function to call when a reminder is due
+        self.remove_fired = remove_fired  # delete fired reminders instead of marking them notified
         self.running = False
         self.thread: Optional[threading.Thread] = None
 
+        self._cond = threading.Condition()
+        self._heap: List[Tuple[float, int, str]] = []  # (due_at, seq, reminder id)
+        self._pending: Dict[str, Dict[str, Any]] = {}  # reminder id -> reminder still waiting to fire
+        self._seq = 0
+
     def _normalize_time(self, time_str: str) -> str:
-        try:
-            cleaned = time_str.strip().upper().replace(" ", "")
-            dt = datetime.strptime(cleaned, "%I:%M%p")
-            return dt.strftime("%H:%M")
-        except (ValueError, AttributeError):
+        normalized = normalize_time(time_str)
+        if not normalized:
             print(f"[ReminderLoop] Invalid time format: {time_str}")
-            return ""
+        return normalized
+
+    def _next_due(self, time_str: str, now: Optional[datetime] = None) -> Optional[float]:
+        """Absolute timestamp of the next occurrence of a '10:30 AM'-style time."""
+        normalized = self._normalize_time(time_str)
+        if not normalized:
+            return None
+        now = now or datetime.now()
+        hour, minute = map(int, normalized.split(":"))
+        due = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        # Still inside the due minute counts as now; anything earlier rolls to tomorrow
+        if due + timedelta(minutes=1) <= now:
+            due += timedelta(days=1)
+        return due.timestamp()
+
+    def _push(self, reminder: Dict[str, Any]) -> None:
+        # Caller holds self._cond
+        self._seq += 1
+        self._pending[reminder["id"]] = reminder
+        heapq.heappush(self._heap, (reminder["due_at"], self._seq, reminder["id"]))
+        self._cond.notify()
+
+    def _load(self) -> None:
+        for reminder in self.memory.get_reminders():
+            if reminder.get("notified") or not reminder.get("id"):
+                continue
+            if reminder.get("due_at") is None:
+                due_at = self._next_due(reminder.get("time", ""))
+                if due_at is None:
+                    continue
+                self.memory.update_reminder(reminder["id"], due_at=due_at)
+                reminder = {**reminder, "due_at": due_at}
+            with self._cond:
+                self._push(reminder)
 
     def start(self):
         if not self.running:
             self.running = True
+            self._load()
             self.thread = threading.Thread(target=self._run, daemon=True)
             self.thread.start()
 
     def _run(self):
-        while self.running:
-            now = datetime.now().strftime("%H:%M")  # 24-hour format e.g. "21:30"
-            reminders = self.memory.get_reminders()
-
-            for reminder in reminders:
-                reminder_time_norm = self._normalize_time(reminder.get("time", ""))
-                if reminder_time_norm == now and not reminder.get("notified"):
-                    print(f"[Reminder] {reminder['task']} at {reminder['time']}")
-                    reminder["notified"] = True  # Prevent repeated notification
-
-            self.memory.set("reminders", reminders)
-            time.sleep(self.check_interval)
-
-    def schedule(self, user: str, task: str, time_str: str):
-        reminder_id = f"{user}-{int(time.time())}"
-        reminder = {
-            "id": reminder_id,
+        while True:
+            with self._cond:
+                reminder = None
+                while self.running and reminder is None:
+                    if not self._heap:
+                        self._cond.wait()
+                        continue
+                    due_at, _, reminder_id = self._heap[0]
+                    delay = due_at - time.time()
+                    if delay > 0:
+                        self._cond.wait(timeout=delay)
+                        continue
+                    heapq.heappop(self._heap)
+                    # Entries for deleted or rescheduled reminders are skipped lazily
+                    candidate = self._pending.get(reminder_id)
+                    if candidate is not None and candidate["due_at"] == due_at:
+                        reminder = self._pending.pop(reminder_id)
+                if not self.running:
+                    return
+            self._fire(reminder)
+
+    def _fire(self, reminder: Dict[str, Any]) -> None:
+        print(f"[Reminder] {reminder['task']} at {reminder['time']}")
+        if self.remove_fired:
+            self.memory.delete_reminder(reminder["id"])
+        else:
+            self.memory.update_reminder(reminder["id"], notified=True)  # Prevent repeated notification
+        if self.notify:
+            try:
+                self.notify(f"⏰ Reminder: {reminder['task']}")
+            except Exception as e:
+                print(f"[Scheduler] Reminder callback failed: {e}")
+
+    def _build_reminder(self, user: str, task: str, time_str: str, reminder_id: Optional[str] = None,
+                        notified: bool = False, due_at: Optional[float] = None) -> Dict[str, Any]:
+        return {
+            "id": reminder_id or f"{user}-{int(time.time())}-{uuid.uuid4().hex[:6]}",
             "user": user,
             "task": task,
             "time": time_str,
-            "notified": False
+            "due_at": self._next_due(time_str) if due_at is None else due_at,
+            "notified": notified
         }
+
+    def schedule(self, user: str, task: str, time_str: str) -> Dict[str, Any]:
+        reminder = self._build_reminder(user, task, time_str)
         self.memory.add_reminder(reminder)
+        if reminder["due_at"] is not None:
+            with self._cond:
+                self._push(reminder)
         print(f"[Scheduler] Scheduled reminder: {reminder}")
+        return reminder
+
+    def apply_batch(self, create: Optional[List[Dict[str, Any]]] = None,
+                    update: Optional[Dict[str, Dict[str, Any]]] = None,
+                    delete: Optional[List[str]] = None) -> Dict[str, Any]:
+        """
+        Create, update and delete many reminders with a single memory write.
+
+        `create` items are {"user", "task", "time"} dicts, `update` maps a reminder
+        id to the fields to change, and `delete` lists reminder ids.
+
+        A `create` item may also carry the `id`, `notified` and `due_at` of an
+        exported reminder; those are kept, and an id that already exists is
+        overwritten rather than duplicated, so export -> import round-trips.
+        """
+        built: Dict[str, Dict[str, Any]] = {}  # by id, so a repeated id keeps its last row
+        for index, item in enumerate(create or []):
+            if not isinstance(item, dict) or not item.get("task") or not item.get("time"):
+                raise ValueError(f"Reminder #{index} needs a 'task' and a 'time'")
+            reminder_id = item.get("id")
+            if reminder_id is not None and not is_reminder_id(reminder_id):
+                raise ValueError(f"Reminder #{index} has an 'id' that is not a string or integer")
+            due_at = item.get("due_at")
+            reminder = self._build_reminder(
+                item.get("user") or "unknown", item["task"], item["time"],
+                reminder_id=str(reminder_id) if reminder_id is not None else None,
+                notified=bool(item.get("notified", False)),
+                due_at=due_at if isinstance(due_at, (int, float)) and not isinstance(due_at, bool) else None,
+            )
+            built[reminder["id"]] = reminder
+
+        changes: Dict[str, Dict[str, Any]] = {}
+        created = []
+        for reminder_id, reminder in built.items():
+            if self.memory.get_reminder(reminder_id) is not None:
+                changes[reminder_id] = {k: v for k, v in reminder.items() if k != "id"}
+            else:
+                created.append(reminder)
+        for reminder_id, fields in (update or {}).items():
+            fields = {k: v for k, v in fields.items() if k != "id"}
+            if "time" in fields:
+                fields["due_at"] = self._next_due(fields["time"])
+            changes[reminder_id] = {**changes.get(reminder_id, {}), **fields}
+        delete = list(delete or [])
+
+        self.memory.batch_reminders(add=created, update=changes, delete=delete)
+
+        updated = [r for r in (self.memory.get_reminder(rid) for rid in changes) if r is not None]
+        with self._cond:
+            for reminder_id in delete:
+                self._pending.pop(reminder_id, None)
+            for reminder in updated:
+                self._pending.pop(reminder["id"], None)
+            for reminder in created + updated:
+                if reminder.get("due_at") is not None and not reminder.get("notified"):
+                    self._push(reminder)
+        print(f"[Scheduler] Batch: {len(created)} created, {len(updated)} updated, {len(delete)} deleted")
+        return {"created": created, "updated": [r["id"] for r in updated], "deleted": delete}
+
+    def clear_notified(self, user: Optional[str] = None) -> int:
+        """Delete every reminder that has already fired, optionally for one user only."""
+        ids = [
+            r["id"] for r in self.memory.get_reminders()
+            if r.get("notified") and (user is None or r.get("user") == user)
+        ]
+        if ids:
+            self.memory.batch_reminders(delete=ids)
+        return len(ids)
+
+    def export_jsonl(self, user: Optional[str] = None) -> Iterator[str]:
+        """Yield reminders one JSON line at a time."""
+        reminders = self.memory.find_reminders(user=user) if user else self.memory.get_reminders()
+        for reminder in reminders:
+            yield json.dumps(reminder) + "\n"
 
     def delete_reminder_by_id(self, reminder_id: str) -> bool:
-        reminders = self.memory.get_reminders()
-        new_reminders = [r for r in reminders if r.get("id") != reminder_id]
-        if len(new_reminders) < len(reminders):
-            self.memory.set("reminders", new_reminders)
+        with self._cond:
+            self._pending.pop(reminder_id, None)
+        if self.memory.delete_reminder(reminder_id):
             print(f"[Scheduler] Deleted reminder with ID: {reminder_id}")
             return True
         print(f"[Scheduler] Reminder ID not found: {reminder_id}")
         return False
 
+    def pending_count(self) -> int:
+        with self._cond:
+            return len(self._pending)
+
     def stop(self):
-        self.running = False
-        if self.thread and self.thread.is_alive():
+        with self._cond:
+            self.running = False
+            self._cond.notify_all()
+        if self.thread and self.thread.is_alive() and self.thread is not threading.current_thread():
             self.thread.join()
 
     def __del__(self):
-        self.stop()
\ No newline at end of file
+        self.stop()
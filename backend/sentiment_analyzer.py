@@ -1,9 +1,54 @@
+import atexit
+from collections import Counter
+import re
+import threading
+from typing import List, Optional
+
+import numpy as np
 import torch
 from transformers import AutoModelForSequenceClassification, AutoTokenizer
 
-# Load model once at module level (for speed)
-tokenizer = AutoTokenizer.from_pretrained("MarieAngeA13/Sentiment-Analysis-BERT")
-model = AutoModelForSequenceClassification.from_pretrained("MarieAngeA13/Sentiment-Analysis-BERT")
+from config import config
+from micro_batcher import MicroBatcher
+from model_loader import models, tensor_bytes
+from sentiment_onnx import OnnxSentimentModel, load_quantized
+from tone_lexicon import quick_label
+from ttl_cache import TTLCache
+
+class TorchSentimentModel:
+    """Full-precision transformers classifier; returns raw logits."""
+
+    backend = "torch"
+
+    def __init__(self, model_name: str):
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        self.model = AutoModelForSequenceClassification.from_pretrained(model_name).eval()
+        self.id2label = self.model.config.id2label
+
+    def memory_bytes(self) -> int:
+        return tensor_bytes(self.model)
+
+    def logits(self, texts: List[str]) -> np.ndarray:
+        inputs = self.tokenizer(texts, return_tensors="pt", padding=True, truncation=True, max_length=512)
+        with torch.no_grad():
+            return self.model(**inputs).logits.numpy()
+
+def load_model():
+    """The int8 ONNX export when configured and available, otherwise the torch model."""
+    if config.SENTIMENT_BACKEND == "onnx":
+        onnx_model = load_quantized(config.SENTIMENT_MODEL, config.SENTIMENT_ONNX_DIR,
+                                    export=config.SENTIMENT_ONNX_AUTO_EXPORT)
+        if onnx_model is not None:
+            return onnx_model
+    return TorchSentimentModel(config.SENTIMENT_MODEL)
+
+# Loaded in the background by the model loader rather than at import
+models.register("sentiment", load_model, warmup=lambda model: model.logits(["Hello, Ren."]),
+                size=config.SENTIMENT_MODEL)
+
+def current_backend() -> Optional[str]:
+    model = models.peek("sentiment")
+    return model.backend if model is not None else None
 
 # Map your labels to emotional tones for Ren
 tone_map = {
@@ -17,18 +62,89 @@ tone_map = {
     "fear": "tense"
 }
 
-def analyze_tone(text: str) -> dict:
-    inputs = tokenizer(text, return_tensors="pt", truncation=True, max_length=512)
-    with torch.no_grad():
-        outputs = model(**inputs)
-    probs = torch.softmax(outputs.logits, dim=1)
-    confidence, predicted_class = torch.max(probs, dim=1)
-
-    raw_label = model.config.id2label[predicted_class.item()].lower()
-    tone = tone_map.get(raw_label, "neutral")
-
-    return {
-        "raw_label": raw_label,
-        "tone": tone,
-        "confidence": round(confidence.item(), 3)
-    }
\ No newline at end of file
+def analyze_tones(texts: List[str]) -> List[dict]:
+    """Classify a batch of texts with one padded forward pass."""
+    model = models.get("sentiment")
+    logits = model.logits(texts)
+    probs = np.exp(logits - logits.max(axis=1, keepdims=True))
+    probs /= probs.sum(axis=1, keepdims=True)
+
+    results = []
+    for predicted_class, confidence in zip(probs.argmax(axis=1), probs.max(axis=1)):
+        raw_label = model.id2label[int(predicted_class)].lower()
+        results.append({
+            "raw_label": raw_label,
+            "tone": tone_map.get(raw_label, "neutral"),
+            "confidence": round(float(confidence), 3)
+        })
+    return results
+
+# Concurrent callers share forward passes instead of competing for CPU threads
+batcher = MicroBatcher(
+    analyze_tones,
+    max_batch_size=config.SENTIMENT_BATCH_SIZE,
+    max_wait_ms=config.SENTIMENT_BATCH_WAIT_MS,
+    name="SentimentBatcher",
+)
+
+# Short replies ("yes", "thanks", ...) repeat constantly, so their results are memoized
+tone_cache = TTLCache(
+    config.SENTIMENT_CACHE_SIZE,
+    ttl=config.SENTIMENT_CACHE_TTL,
+    path=config.SENTIMENT_CACHE_FILE or None,
+)
+atexit.register(tone_cache.save)
+
+def cache_key(text: str, backend: Optional[str] = None) -> str:
+    """
+    Collapse whitespace and case so trivially different repeats share an entry.
+    Keys are prefixed with the model and backend that produced the label, so
+    switching SENTIMENT_MODEL or SENTIMENT_BACKEND never serves stale results
+    from the persisted cache.
+    """
+    if backend is None:
+        # Before the model has loaded, assume the configured backend is the one that will serve
+        backend = current_backend() or (
+            OnnxSentimentModel.backend if config.SENTIMENT_BACKEND == "onnx" else TorchSentimentModel.backend)
+    return f"{config.SENTIMENT_MODEL}|{backend}|" + re.sub(r"\s+", " ", text).strip().casefold()
+
+# How each turn was labelled: "lexicon" and "cache" turns skipped the model
+tier_counts: Counter = Counter()
+_tier_lock = threading.Lock()
+
+def _count(tier: str) -> None:
+    with _tier_lock:
+        tier_counts[tier] += 1
+
+def tier_stats() -> dict:
+    with _tier_lock:
+        counts = dict(tier_counts)
+    turns = sum(counts.values())
+    skipped = counts.get("lexicon", 0) + counts.get("cache", 0)
+    return {"turns": turns, **counts, "skip_fraction": round(skipped / turns, 3) if turns else 0.0}
+
+def analyze_tone(text: str, expecting_reply: bool = False) -> dict:
+    """
+    Tiered tone analysis: the lexicon tier answers formulaic turns, then the
+    result cache, and only what's left goes to the transformer.
+    `expecting_reply` marks answers to a question Ren just asked.
+    """
+    if config.TONE_LEXICON:
+        quick = quick_label(text, expecting_reply, max_words=config.TONE_LEXICON_MAX_WORDS)
+        if quick is not None:
+            _count("lexicon")
+            raw_label, confidence = quick
+            return {"raw_label": raw_label, "tone": tone_map.get(raw_label, "neutral"), "confidence": confidence}
+
+    cacheable = len(text) <= config.SENTIMENT_CACHE_MAX_CHARS
+    if cacheable:
+        cached = tone_cache.get(cache_key(text))
+        if cached is not None:
+            _count("cache")
+            return dict(cached)
+    model = models.get("sentiment")  # raise ModelNotReady now rather than from the batch worker
+    result = batcher.run(text)
+    _count("model")
+    if cacheable:
+        tone_cache.put(cache_key(text, model.backend), dict(result))
+    return result
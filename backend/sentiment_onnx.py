@@ -0,0 +1,105 @@
+# sentiment_onnx.py
+# int8-quantized ONNX Runtime export of the sentiment model, cached on disk
+
+import json
+import logging
+import os
+import shutil
+from typing import Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+MODEL_FILE = "model.int8.onnx"
+META_FILE = "meta.json"
+INPUT_NAMES = ("input_ids", "attention_mask", "token_type_ids")
+
+def export_quantized(model_name: str, artifact_dir: str) -> str:
+    """
+    Export `model_name` to ONNX, quantize its weights to int8 (dynamic
+    quantization) and save it with its tokenizer and config in `artifact_dir`.
+    Needs torch, transformers and onnx; serving the result only needs onnxruntime.
+    """
+    import torch
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModelForSequenceClassification.from_pretrained(model_name).eval()
+    sample = tokenizer(["Ren, it has been a long day."], return_tensors="pt")
+    names = [name for name in INPUT_NAMES if name in sample]
+
+    # Build in a scratch directory and swap it in, so a crash never leaves a half-written artifact
+    build_dir = artifact_dir.rstrip("/\\") + ".tmp"
+    shutil.rmtree(build_dir, ignore_errors=True)
+    os.makedirs(build_dir)
+    fp32_path = os.path.join(build_dir, "model.fp32.onnx")
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            tuple(sample[name] for name in names),
+            fp32_path,
+            input_names=names,
+            output_names=["logits"],
+            dynamic_axes={**{name: {0: "batch", 1: "sequence"} for name in names}, "logits": {0: "batch"}},
+            opset_version=14,
+        )
+    quantize_dynamic(fp32_path, os.path.join(build_dir, MODEL_FILE), weight_type=QuantType.QInt8)
+    os.remove(fp32_path)
+    tokenizer.save_pretrained(build_dir)
+    model.config.save_pretrained(build_dir)
+    with open(os.path.join(build_dir, META_FILE), "w") as f:
+        json.dump({"model": model_name, "quantization": "dynamic-int8"}, f)
+
+    shutil.rmtree(artifact_dir, ignore_errors=True)
+    os.makedirs(os.path.dirname(os.path.abspath(artifact_dir)), exist_ok=True)
+    os.replace(build_dir, artifact_dir)
+    logger.info(f"[SentimentONNX] Exported {model_name} to {artifact_dir}")
+    return artifact_dir
+
+class OnnxSentimentModel:
+    """Quantized sentiment classifier served by onnxruntime; returns raw logits like the torch model."""
+
+    backend = "onnx-int8"
+
+    def __init__(self, artifact_dir: str):
+        import onnxruntime as ort
+        from transformers import AutoConfig, AutoTokenizer
+
+        self.artifact_dir = artifact_dir
+        self.session = ort.InferenceSession(os.path.join(artifact_dir, MODEL_FILE), providers=["CPUExecutionProvider"])
+        self.input_names = [i.name for i in self.session.get_inputs()]
+        self.tokenizer = AutoTokenizer.from_pretrained(artifact_dir)
+        self.id2label: Dict[int, str] = AutoConfig.from_pretrained(artifact_dir).id2label
+
+    def memory_bytes(self) -> int:
+        # onnxruntime holds the int8 initializers in memory, so the file size is a close estimate
+        return os.path.getsize(os.path.join(self.artifact_dir, MODEL_FILE))
+
+    def logits(self, texts: List[str]) -> np.ndarray:
+        inputs = self.tokenizer(texts, return_tensors="np", padding=True, truncation=True, max_length=512)
+        feed = {name: inputs[name].astype(np.int64) for name in self.input_names}
+        return self.session.run(["logits"], feed)[0]
+
+def load_quantized(model_name: str, artifact_dir: str, export: bool = False) -> Optional[OnnxSentimentModel]:
+    """
+    Return the cached quantized model, exporting it first when `export` is set.
+    Returns None (callers fall back to torch) when the artifact is missing,
+    was built from a different model, or onnxruntime can't load it.
+    """
+    try:
+        meta_path = os.path.join(artifact_dir, META_FILE)
+        meta = {}
+        if os.path.exists(meta_path):
+            with open(meta_path, "r") as f:
+                meta = json.load(f)
+        if meta.get("model") != model_name:
+            if not export:
+                logger.warning(f"[SentimentONNX] No quantized artifact for {model_name} in {artifact_dir}")
+                return None
+            export_quantized(model_name, artifact_dir)
+        return OnnxSentimentModel(artifact_dir)
+    except Exception as e:
+        logger.error(f"[SentimentONNX] Could not load quantized model: {e}")
+        return None
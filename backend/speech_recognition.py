@@ -1,63 +1,55 @@
 # speech_recognition.py
-import queue
 import threading
 
-import numpy as np
 import sounddevice as sd
-import torch
-import whisper
 
-# Load Whisper model
-model = whisper.load_model("base")
+from audio_stream import WindowedTranscriber
+from config import config
+from model_loader import models
+from transcription import load_backend
+from transcription_pool import TranscriptionPool
 
 SAMPLE_RATE = 16000
+
+def load_transcriber():
+    # TRANSCRIBE_WORKERS > 0 runs the model in that many worker processes; 0 keeps it in-process
+    if config.TRANSCRIBE_WORKERS > 0:
+        return TranscriptionPool(model_size=config.WHISPER_MODEL)
+    return load_backend(model_size=config.WHISPER_MODEL)
+
+# The configured transcription backend is loaded (and warmed up on a second of
+# silence) in the background by the model loader
+models.register("whisper", load_transcriber, warmup=lambda model: model.warm_up(), size=config.WHISPER_MODEL)
+
 BLOCK_SIZE = int(SAMPLE_RATE * 0.5)  # 0.5 seconds
 
-audio_queue = queue.Queue()
 stop_flag = threading.Event()
 
-def audio_callback(indata, frames, time, status):
-    if status:
-        print("[AudioStream Warning]", status)
-    audio_queue.put(indata.copy())
-
 def stream_transcription(callback):
     """
-    Continuously transcribe live audio and call `callback(text)` with partial results.
-    Supports both Whisper and faster-whisper decoding styles.
+    Continuously transcribe live audio and call `callback(text)` with partial results,
+    using whichever transcription backend is configured.
     """
-    print("[Ren] Starting real-time transcription...")
-    with sd.InputStream(samplerate=SAMPLE_RATE, channels=1, blocksize=BLOCK_SIZE, callback=audio_callback):
-        audio_buffer = []
-
-        while not stop_flag.is_set():
-            try:
-                chunk = audio_queue.get(timeout=1)
-                audio_np = np.squeeze(chunk)
-                audio_buffer.extend(audio_np)
-
-                if len(audio_buffer) >= SAMPLE_RATE * 3:
-                    audio_input = np.array(audio_buffer[-SAMPLE_RATE * 5:])
-                    mel = whisper.log_mel_spectrogram(audio_input).to(model.device)
-
-                    with torch.no_grad():
-                        options = whisper.DecodingOptions(language="en", fp16=False, without_timestamps=True)
-                        result = whisper.decode(model, mel, options)
-
-                    # Unified decoding handling
-                    if isinstance(result, list):  # For faster-whisper-style
-                        text = " ".join([r.text.strip() for r in result if hasattr(r, "text")])
-                    else:  # Standard OpenAI Whisper
-                        text = result.text.strip() if hasattr(result, "text") else ""
-
-                    if text:
-                        print("[Whisper Partial]", text)
-                        callback(text)
-
-                    audio_buffer = []
-            except queue.Empty:
-                continue
+    # Leased for the whole session so the idle sweeper can't unload it mid-stream
+    with models.lease("whisper", wait=True) as model:
+        transcriber = WindowedTranscriber(model, slack_samples=BLOCK_SIZE)
+
+        def audio_callback(indata, frames, time, status):
+            if status:
+                print("[AudioStream Warning]", status)
+            transcriber.write(indata[:, 0])
+
+        print("[Ren] Starting real-time transcription...")
+        with sd.InputStream(samplerate=SAMPLE_RATE, channels=1, dtype="float32", blocksize=BLOCK_SIZE,
+                            callback=audio_callback):
+            while not stop_flag.is_set():
+                if not transcriber.wait(timeout=1):
+                    continue
+                new_text = transcriber.decode()
+                if new_text:
+                    print("[Whisper Partial]", new_text)
+                    callback(new_text)
 
 def stop_stream():
     stop_flag.set()
-    print("[Ren] Stopping transcription.")
\ No newline at end of file
+    print("[Ren] Stopping transcription.")
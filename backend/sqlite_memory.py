@@ -0,0 +1,301 @@
+# sqlite_memory.py
+# SQLite storage backend for PersistentMemory: key/values plus an indexed reminders table
+
+from contextlib import contextmanager
+import json
+import os
+import sqlite3
+import threading
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from persistent_memory import FrozenDict, PersistentMemory, freeze, normalize_time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS kv (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS reminders (
+    id TEXT PRIMARY KEY,
+    user TEXT,
+    task TEXT,
+    time TEXT,
+    due_time TEXT,
+    notified INTEGER NOT NULL DEFAULT 0,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_reminders_due ON reminders (due_time, notified);
+CREATE INDEX IF NOT EXISTS idx_reminders_user ON reminders (user);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+INSERT OR IGNORE INTO meta (key, value) VALUES ('version', '0');
+"""
+
+class SQLiteMemory(PersistentMemory):
+    """
+    Drop-in PersistentMemory backed by a local SQLite file.
+
+    Every mutation touches only the affected row, and reminders are indexed by
+    due time and user so due lookups and cancellations don't scan the whole list.
+    The "reminders" key is served from the reminders table.
+
+    As on the JSON backend, values come back frozen (FrozenDict / tuples) and
+    every committed write bumps a version stored in the database, which
+    `snapshot()`, `update()` and `compare_and_set()` are built on.
+    """
+
+    def __init__(self, db_path: str, migrate_from: Optional[str] = None):
+        self.file_path = db_path
+        self._lock = threading.Lock()
+        # Autocommit mode: transactions are opened explicitly by _transaction()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        # Reads use one connection per thread so, under WAL, they never wait on
+        # the writer lock; all writes go through the single locked `_conn`.
+        self._readers = threading.local()
+        self._reader_conns: List[sqlite3.Connection] = []
+        self._readers_lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(SCHEMA)
+        if migrate_from:
+            self.migrate_from_json(migrate_from)
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        """
+        One serialized write. BEGIN IMMEDIATE takes SQLite's write lock up front,
+        so a read-modify-write inside it can't interleave with another writer
+        (even another process); if the block changed any row, the version is
+        bumped in the same transaction.
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                changes = self._conn.total_changes
+                yield self._conn
+                if self._conn.total_changes != changes:
+                    self._conn.execute("UPDATE meta SET value = CAST(value AS INTEGER) + 1 WHERE key = 'version'")
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    @staticmethod
+    def _read_version(conn: sqlite3.Connection) -> int:
+        return int(conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()["value"])
+
+    @property
+    def version(self) -> int:
+        return self._read_version(self._reader())
+
+    # ── Migration ────────────────────────────────────
+    def migrate_from_json(self, json_path: str) -> bool:
+        """
+        One-shot import of a JSON memory file (plus any journal). Runs once per
+        database; the JSON file is left untouched.
+        """
+        if self._get_meta("migrated_from") or not os.path.exists(json_path):
+            return False
+
+        source = PersistentMemory(json_path, journal=True, flush_interval_ms=0)
+        data = dict(source.all())
+        reminders = data.pop("reminders", [])
+        with self._transaction():
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO kv (key, value) VALUES (?, ?)",
+                [(key, json.dumps(value)) for key, value in data.items()],
+            )
+            self._conn.executemany(self._REMINDER_UPSERT, [self._reminder_row(r) for r in reminders])
+            self._conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('migrated_from', ?)",
+                (os.path.abspath(json_path),),
+            )
+        print(f"[SQLiteMemory] Migrated {len(data)} keys and {len(reminders)} reminders from {json_path}")
+        return True
+
+    def _reader(self) -> sqlite3.Connection:
+        conn = getattr(self._readers, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.file_path, check_same_thread=False, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            self._readers.conn = conn
+            with self._readers_lock:
+                self._reader_conns.append(conn)
+        return conn
+
+    def _get_meta(self, key: str) -> Optional[str]:
+        row = self._reader().execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row["value"] if row else None
+
+    # ── Key/value API ────────────────────────────────
+    def get(self, key: str, default=None) -> Any:
+        return self._get(self._reader(), key, default)
+
+    def _get(self, conn: sqlite3.Connection, key: str, default=None) -> Any:
+        if key == "reminders":
+            return tuple(self._query_reminders(conn=conn))
+        row = conn.execute("SELECT value FROM kv WHERE key = ?", (key,)).fetchone()
+        return freeze(json.loads(row["value"])) if row else default
+
+    def _set(self, key: str, value: Any) -> None:
+        # Call inside _transaction()
+        if key == "reminders":
+            self._conn.execute("DELETE FROM reminders")
+            self._conn.executemany(self._REMINDER_UPSERT, [self._reminder_row(r) for r in value])
+        else:
+            self._conn.execute("INSERT OR REPLACE INTO kv (key, value) VALUES (?, ?)", (key, json.dumps(value)))
+
+    def set(self, key: str, value: Any) -> None:
+        try:
+            with self._transaction():
+                self._set(key, value)
+        except Exception as e:
+            print(f"[SQLiteMemory] Error saving {key}: {e}")
+
+    def delete(self, key: str) -> None:
+        with self._transaction():
+            if key == "reminders":
+                self._conn.execute("DELETE FROM reminders")
+            else:
+                self._conn.execute("DELETE FROM kv WHERE key = ?", (key,))
+
+    def all(self) -> Dict[str, Any]:
+        return self._all(self._reader())
+
+    def _all(self, conn: sqlite3.Connection) -> Dict[str, Any]:
+        rows = conn.execute("SELECT key, value FROM kv").fetchall()
+        data = {row["key"]: freeze(json.loads(row["value"])) for row in rows}
+        data["reminders"] = tuple(self._query_reminders(conn=conn))
+        return FrozenDict(data)
+
+    def snapshot(self) -> Tuple[int, Dict[str, Any]]:
+        """Return (version, read-only memory) read in one transaction, so both agree."""
+        conn = self._reader()
+        conn.execute("BEGIN")
+        try:
+            return self._read_version(conn), self._all(conn)
+        finally:
+            conn.execute("COMMIT")
+
+    def update(self, key: str, fn: Callable[[Any], Any], default=None) -> Any:
+        """Atomically replace `key` with fn(current value) and return the new value."""
+        with self._transaction() as conn:
+            self._set(key, fn(self._get(conn, key, default)))
+            return self._get(conn, key)
+
+    def compare_and_set(self, key: str, value: Any, expected_version: int) -> bool:
+        """Set `key` only if nothing was committed since `expected_version`."""
+        with self._transaction() as conn:
+            if self._read_version(conn) != expected_version:
+                return False
+            self._set(key, value)
+            return True
+
+    def save(self) -> None:
+        # Every write is already committed
+        pass
+
+    def flush(self) -> None:
+        pass
+
+    def compact(self) -> None:
+        with self._lock:
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+        # Every thread that read through this store opened its own connection
+        with self._readers_lock:
+            for conn in self._reader_conns:
+                conn.close()
+            self._reader_conns.clear()
+
+    # ── Reminders ────────────────────────────────────
+    _REMINDER_UPSERT = (
+        "INSERT INTO reminders (id, user, task, time, due_time, notified, data) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?) "
+        "ON CONFLICT(id) DO UPDATE SET user = excluded.user, task = excluded.task, time = excluded.time, "
+        "due_time = excluded.due_time, notified = excluded.notified, data = excluded.data"
+    )
+
+    @staticmethod
+    def _reminder_row(reminder: Dict[str, Any]) -> tuple:
+        return (
+            reminder.get("id"),
+            reminder.get("user"),
+            reminder.get("task", ""),
+            reminder.get("time", ""),
+            normalize_time(reminder.get("time", "")),
+            1 if reminder.get("notified") else 0,
+            json.dumps(reminder),
+        )
+
+    def _query_reminders(self, where: str = "", params: tuple = (),
+                         conn: Optional[sqlite3.Connection] = None) -> List[Dict[str, Any]]:
+        rows = (conn or self._reader()).execute(f"SELECT data FROM reminders {where} ORDER BY rowid", params).fetchall()
+        return [freeze(json.loads(row["data"])) for row in rows]
+
+    def add_reminder(self, reminder: Dict[str, Any]) -> None:
+        with self._transaction():
+            self._conn.execute(self._REMINDER_UPSERT, self._reminder_row(reminder))
+
+    def get_reminders(self) -> list:
+        return self._query_reminders()
+
+    def delete_reminder(self, reminder_id: str) -> bool:
+        with self._transaction():
+            cursor = self._conn.execute("DELETE FROM reminders WHERE id = ?", (reminder_id,))
+        return cursor.rowcount > 0
+
+    def update_reminder(self, reminder_id: str, **fields: Any) -> None:
+        with self._transaction():
+            row = self._conn.execute("SELECT data FROM reminders WHERE id = ?", (reminder_id,)).fetchone()
+            if row is None:
+                return
+            reminder = json.loads(row["data"])
+            reminder.update(fields)
+            self._conn.execute(self._REMINDER_UPSERT, self._reminder_row(reminder))
+
+    def get_reminder(self, reminder_id: str) -> Optional[Dict[str, Any]]:
+        rows = self._query_reminders("WHERE id = ?", (reminder_id,))
+        return rows[0] if rows else None
+
+    def batch_reminders(self, add: Optional[List[Dict[str, Any]]] = None,
+                        update: Optional[Dict[str, Dict[str, Any]]] = None,
+                        delete: Optional[List[str]] = None) -> None:
+        with self._transaction():
+            if delete:
+                self._conn.executemany("DELETE FROM reminders WHERE id = ?", [(rid,) for rid in delete])
+            for reminder_id, fields in (update or {}).items():
+                row = self._conn.execute("SELECT data FROM reminders WHERE id = ?", (reminder_id,)).fetchone()
+                if row is not None:
+                    self._conn.execute(self._REMINDER_UPSERT, self._reminder_row({**json.loads(row["data"]), **fields}))
+            if add:
+                self._conn.executemany(self._REMINDER_UPSERT, [self._reminder_row(r) for r in add])
+
+    def get_due_reminders(self, due_time: str, include_notified: bool = False) -> List[Dict[str, Any]]:
+        if include_notified:
+            return self._query_reminders("WHERE due_time = ?", (due_time,))
+        return self._query_reminders("WHERE due_time = ? AND notified = 0", (due_time,))
+
+    def find_reminders(self, user: Optional[str] = None, task: Optional[str] = None,
+                       time: Optional[str] = None) -> List[Dict[str, Any]]:
+        clauses, params = [], []
+        if user:
+            clauses.append("user = ?")
+            params.append(user)
+        if time and normalize_time(time):
+            clauses.append("due_time = ?")
+            params.append(normalize_time(time))
+        elif time:
+            clauses.append("instr(lower(time), ?) > 0")
+            params.append(time.strip().lower())
+        if task:
+            clauses.append("instr(lower(task), ?) > 0")
+            params.append(task.lower())
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        return self._query_reminders(where, tuple(params))
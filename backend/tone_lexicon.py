@@ -0,0 +1,51 @@
+# tone_lexicon.py
+# Cheap first tier of the tone pipeline: answers formulaic turns without running the transformer
+
+import re
+from typing import Optional, Tuple
+
+# Bare acknowledgements, confirmations and pleasantries
+NEUTRAL_PAT = re.compile(
+    r"^(yes|yeah|yep|yup|sure|ok(ay)?|correct|right|no|nope|nah|cancel|incorrect|"
+    r"hi|hello|hey|bye|goodbye|good (morning|afternoon|evening|night)|got it|noted|done|next|stop|"
+    r"never ?mind|go ahead|that'?s (it|all|right|correct))"
+    r"( ren)?[\s!.,?]*$",
+    re.I,
+)
+POSITIVE_PAT = re.compile(
+    r"^(thanks|thank you|thx|ty|cool|great|perfect|awesome|nice|sounds good|love it)( (so much|ren))?[\s!.,]*$",
+    re.I,
+)
+# Slot answers that are only a time: "7", "at 5:30 pm", "tomorrow", "in 2 hours"
+TIME_ONLY_PAT = re.compile(
+    r"^(at\s+)?(\d{1,2}(:\d{2})?\s*(am|pm)?|noon|midnight|tomorrow|tonight|later|"
+    r"in\s+\d+\s+(min|mins|minutes|hour|hours|days)|(this|tomorrow) (morning|afternoon|evening))[\s.!]*$",
+    re.I,
+)
+# Any of these means the turn carries real feeling, so the transformer decides
+EMOTION_PAT = re.compile(
+    r"\b(sad|upset|angry|mad|furious|hate|awful|terrible|horrible|worst|tired|exhausted|stressed|anxious|"
+    r"nervous|scared|afraid|worried|lonely|depressed|hurt|cry|crying|overwhelmed|frustrated|annoyed|"
+    r"happy|excited|love|amazing|glad|proud|sorry|miss|wow|ugh|damn|not)\b|!!|\?\?",
+    re.I,
+)
+
+def quick_label(text: str, expecting_reply: bool = False, max_words: int = 6) -> Optional[Tuple[str, float]]:
+    """
+    Return (raw_label, confidence) when the input is formulaic enough to label
+    without the model, or None when the transformer should decide.
+
+    `expecting_reply` marks turns that answer a question Ren just asked (a
+    reminder slot, a yes/no confirmation); short answers there are neutral
+    unless they carry emotional words.
+    """
+    stripped = text.strip()
+    if not stripped:
+        return "neutral", 0.9
+    if POSITIVE_PAT.match(stripped):
+        return "positive", 0.9
+    if NEUTRAL_PAT.match(stripped) or TIME_ONLY_PAT.match(stripped):
+        return "neutral", 0.9
+    if expecting_reply and len(stripped.split()) <= max_words and not EMOTION_PAT.search(stripped):
+        return "neutral", 0.85
+    return None
@@ -0,0 +1,116 @@
+# transcription.py
+# Speech-to-text backends behind one interface, selected by config.TRANSCRIBE_BACKEND
+#
+#   whisper         openai-whisper, fp32 PyTorch (the original backend)
+#   faster-whisper  CTranslate2 with int8 weights; same models, several times
+#                   less CPU time per second of audio
+#
+# Real-time factor (RTF) = processing seconds / audio seconds; below 1.0 is
+# faster than real time. Measure it on the target host with
+#     python bench_transcription.py some_clip.wav
+# which reports RTF per backend for the configured model size.
+
+from abc import ABC, abstractmethod
+import logging
+from typing import Any, Dict, List, Optional, Union
+
+import numpy as np
+
+from config import config
+from model_loader import tensor_bytes
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = 16000
+
+Audio = Union[str, np.ndarray]  # file path, or 16 kHz mono float32 samples
+
+class TranscriptionBackend(ABC):
+    """
+    Common interface for speech-to-text engines.
+
+    `transcribe(audio, language=None)` returns the openai-whisper result shape
+    that callers already use: {"text": str, "segments": [{"start", "end", "text"}],
+    "language": str}.
+    """
+
+    name = "base"
+
+    @abstractmethod
+    def transcribe(self, audio: Audio, language: Optional[str] = None) -> Dict[str, Any]:
+        ...
+
+    def warm_up(self) -> None:
+        """Run one decode on a second of silence so the first real request isn't slow."""
+        self.transcribe(np.zeros(SAMPLE_RATE, dtype=np.float32))
+
+class WhisperBackend(TranscriptionBackend):
+    """openai-whisper running fp32 PyTorch on CPU."""
+
+    name = "whisper"
+
+    def __init__(self, model_size: str):
+        import whisper
+
+        self.model_size = model_size
+        self.model = whisper.load_model(model_size)
+
+    def memory_bytes(self) -> int:
+        return tensor_bytes(self.model)
+
+    def transcribe(self, audio: Audio, language: Optional[str] = None) -> Dict[str, Any]:
+        result = self.model.transcribe(audio, language=language, fp16=False)
+        return {
+            "text": result.get("text", "").strip(),
+            "segments": [
+                {"start": s["start"], "end": s["end"], "text": s["text"].strip()}
+                for s in result.get("segments", [])
+            ],
+            "language": result.get("language", language),
+        }
+
+class FasterWhisperBackend(TranscriptionBackend):
+    """faster-whisper (CTranslate2) with int8-quantized weights by default."""
+
+    name = "faster-whisper"
+
+    def __init__(self, model_size: str, compute_type: Optional[str] = None, cpu_threads: Optional[int] = None):
+        from faster_whisper import WhisperModel
+
+        self.model_size = model_size
+        self.compute_type = compute_type or config.WHISPER_COMPUTE_TYPE
+        self.model = WhisperModel(
+            model_size,
+            device="cpu",
+            compute_type=self.compute_type,
+            cpu_threads=config.WHISPER_CPU_THREADS if cpu_threads is None else cpu_threads,
+        )
+
+    def transcribe(self, audio: Audio, language: Optional[str] = None) -> Dict[str, Any]:
+        segments, info = self.model.transcribe(audio, language=language, beam_size=config.WHISPER_BEAM_SIZE)
+        # Segments are generated lazily; decoding happens while this list is built
+        segments: List[Dict[str, Any]] = [
+            {"start": s.start, "end": s.end, "text": s.text.strip()} for s in segments
+        ]
+        return {
+            "text": " ".join(s["text"] for s in segments if s["text"]).strip(),
+            "segments": segments,
+            "language": info.language,
+        }
+
+BACKENDS = {
+    WhisperBackend.name: WhisperBackend,
+    FasterWhisperBackend.name: FasterWhisperBackend,
+}
+
+def load_backend(name: Optional[str] = None, model_size: str = "base") -> TranscriptionBackend:
+    """Build the configured backend; faster-whisper falls back to openai-whisper if it isn't installed."""
+    name = (name or config.TRANSCRIBE_BACKEND).lower()
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown transcription backend '{name}', expected one of {sorted(BACKENDS)}")
+    if name == FasterWhisperBackend.name:
+        try:
+            return FasterWhisperBackend(model_size)
+        except ImportError:
+            logger.warning("[Transcription] faster-whisper not installed, using openai-whisper")
+    return WhisperBackend(model_size)
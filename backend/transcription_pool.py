@@ -0,0 +1,249 @@
+# transcription_pool.py
+# Pool of worker processes, each holding its own transcription model, behind a bounded job queue
+
+from collections import deque
+from concurrent.futures import Future
+import logging
+import os
+import pickle
+import queue
+import subprocess
+import sys
+import threading
+import time
+from typing import Any, Deque, Dict, List, Optional
+
+import numpy as np
+
+from config import config
+from model_loader import ModelNotReady, rss_bytes
+from transcription import SAMPLE_RATE, Audio, TranscriptionBackend
+
+logger = logging.getLogger(__name__)
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "transcription_worker.py")
+
+class TranscriptionQueueFull(ModelNotReady):
+    """Every worker is busy and the job queue is full; retry shortly."""
+
+    def __init__(self, retry_after: int):
+        super().__init__("whisper", "busy", retry_after)
+
+def _percentiles(samples: Deque[float]) -> Dict[str, Optional[float]]:
+    if not samples:
+        return {"p50": None, "p95": None}
+    ordered = sorted(samples)
+    pick = lambda q: round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 1)
+    return {"p50": pick(0.5), "p95": pick(0.95)}
+
+class TranscriptionPool(TranscriptionBackend):
+    """
+    Runs transcription in `workers` separate processes so decoding neither
+    holds the server's GIL nor competes with other requests for one model.
+
+    Jobs wait in a queue bounded at `queue_size`; `submit` returns a Future,
+    or raises TranscriptionQueueFull (a 503 with Retry-After) when the queue
+    is full. One thread per worker feeds its process over a pipe and
+    restarts the process if it dies. Each worker gets cpu_count / workers
+    threads so the pool uses the cores without oversubscribing them.
+    """
+
+    name = "pool"
+
+    def __init__(self, workers: Optional[int] = None, queue_size: Optional[int] = None,
+                 backend: Optional[str] = None, model_size: str = "base"):
+        self.workers = max(1, workers or config.TRANSCRIBE_WORKERS)
+        self.backend = backend or config.TRANSCRIBE_BACKEND
+        self.model_size = model_size
+        self._jobs: "queue.Queue[Optional[tuple]]" = queue.Queue(maxsize=max(1, queue_size or config.TRANSCRIBE_QUEUE_SIZE))
+        self._lock = threading.Lock()
+        self._closed = False
+        self._ready = [threading.Event() for _ in range(self.workers)]
+        self._alive = [False] * self.workers
+        self._processes: List[Optional[subprocess.Popen]] = [None] * self.workers
+        self.errors: List[Optional[str]] = [None] * self.workers
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.restarts = 0
+        self._wait_times: Deque[float] = deque(maxlen=500)
+        self._service_times: Deque[float] = deque(maxlen=500)
+
+        threads = max(1, (os.cpu_count() or 1) // self.workers)
+        self._env = {**os.environ, "OMP_NUM_THREADS": str(threads), "MKL_NUM_THREADS": str(threads)}
+        for index in range(self.workers):
+            threading.Thread(target=self._serve, args=(index,), name=f"transcriber-{index}", daemon=True).start()
+
+    # ── Worker processes ─────────────────────────────
+    def _spawn(self, index: int) -> Optional[subprocess.Popen]:
+        process = subprocess.Popen(
+            [sys.executable, WORKER_SCRIPT, self.backend, self.model_size],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, env=self._env,
+        )
+        try:
+            status, detail = pickle.load(process.stdout)
+        except EOFError:
+            status, detail = "error", f"worker exited with code {process.wait()}"
+        if status != "ready":
+            logger.error(f"[TranscriptionPool] Worker {index} failed to load: {detail}")
+            self.errors[index] = detail
+            process.kill()
+            return None
+        self._processes[index] = process
+        return process
+
+    def _serve(self, index: int) -> None:
+        process = self._spawn(index)
+        if process is not None:
+            try:
+                self._call(process, np.zeros(SAMPLE_RATE, dtype=np.float32), None)  # warm-up
+            except Exception as e:
+                logger.warning(f"[TranscriptionPool] Worker {index} warm-up failed: {e}")
+        self._alive[index] = process is not None
+        self._ready[index].set()
+        if process is None and all(event.is_set() for event in self._ready) and not any(self._alive):
+            self._fail_queued("No transcription worker could load a model")
+
+        while process is not None:
+            job = self._jobs.get()
+            if job is None:
+                break
+            audio, language, future, enqueued_at = job
+            if not future.set_running_or_notify_cancel():
+                continue
+            started = time.perf_counter()
+            with self._lock:
+                self.in_flight += 1
+            try:
+                future.set_result(self._call(process, audio, language))
+                outcome = "completed"
+            except (EOFError, BrokenPipeError, OSError) as e:
+                # The worker died mid-job (or close() stopped it): fail this job and,
+                # unless the pool is closing, bring up a fresh process
+                future.set_exception(RuntimeError(f"Transcription worker crashed: {e}"))
+                outcome = "failed"
+                process.kill()
+                process = None
+                if not self._closed:
+                    with self._lock:
+                        self.restarts += 1
+                    process = self._spawn(index)
+                self._alive[index] = process is not None
+                if process is None and (self._closed or not any(self._alive)):
+                    self._fail_queued("Transcription pool is closed" if self._closed else "No transcription workers are running")
+            except Exception as e:
+                future.set_exception(e)
+                outcome = "failed"
+            finished = time.perf_counter()
+            with self._lock:
+                self.in_flight -= 1
+                setattr(self, outcome, getattr(self, outcome) + 1)
+                self._wait_times.append(started - enqueued_at)
+                self._service_times.append(finished - started)
+
+        if process is not None:
+            process.stdin.close()
+            process.wait(timeout=5)
+
+    def _fail_queued(self, reason: str) -> None:
+        """With no worker left to serve them, fail waiting jobs now instead of letting them time out."""
+        stops = 0
+        while True:
+            try:
+                job = self._jobs.get_nowait()
+            except queue.Empty:
+                break
+            if job is None:
+                stops += 1  # close()'s stop signal for another worker; handed back below
+            elif job[2].set_running_or_notify_cancel():
+                job[2].set_exception(RuntimeError(f"{reason}: {self.errors}"))
+                with self._lock:
+                    self.failed += 1
+        for _ in range(stops):
+            self._jobs.put(None)
+
+    @staticmethod
+    def _call(process: subprocess.Popen, audio: Audio, language: Optional[str]) -> Dict[str, Any]:
+        pickle.dump((audio, language), process.stdin, protocol=pickle.HIGHEST_PROTOCOL)
+        process.stdin.flush()
+        status, payload = pickle.load(process.stdout)
+        if status != "ok":
+            raise RuntimeError(f"Transcription failed: {payload}")
+        return payload
+
+    # ── Submitting ───────────────────────────────────
+    def submit(self, audio: Audio, language: Optional[str] = None,
+               block: bool = False) -> "Future[Dict[str, Any]]":
+        """Queue a job; a full queue is rejected straight away unless `block` waits for room."""
+        if self._closed:
+            raise RuntimeError("Transcription pool is closed")
+        if all(event.is_set() for event in self._ready) and not any(self._alive):
+            raise RuntimeError(f"No transcription workers are running: {self.errors}")
+        future: "Future[Dict[str, Any]]" = Future()
+        try:
+            self._jobs.put((audio, language, future, time.perf_counter()), block=block,
+                           timeout=config.TRANSCRIBE_TIMEOUT if block else None)
+        except queue.Full:
+            with self._lock:
+                self.rejected += 1
+            raise TranscriptionQueueFull(config.MODEL_RETRY_AFTER)
+        return future
+
+    def transcribe(self, audio: Audio, language: Optional[str] = None) -> Dict[str, Any]:
+        return self.submit(audio, language).result(timeout=config.TRANSCRIBE_TIMEOUT)
+
+    def map(self, chunks: List[Audio], language: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Transcribe many chunks in parallel, returning results in order. At most
+        one job per worker is outstanding at a time, so a long recording
+        doesn't fill the queue and shut out other requests; once admitted it
+        waits for queue room rather than being rejected part-way through.
+        """
+        pending: Deque["Future[Dict[str, Any]]"] = deque()
+        results = []
+        for chunk in chunks:
+            if len(pending) >= self.workers:
+                results.append(pending.popleft().result(timeout=config.TRANSCRIBE_TIMEOUT))
+            pending.append(self.submit(chunk, language, block=True))
+        results.extend(future.result(timeout=config.TRANSCRIBE_TIMEOUT) for future in pending)
+        return results
+
+    def warm_up(self) -> None:
+        """Wait for every worker to load its model; fails if none could."""
+        for event in self._ready:
+            event.wait()
+        if not any(self._alive):
+            raise RuntimeError(f"No transcription worker could load a model: {self.errors}")
+
+    # ── Lifecycle ────────────────────────────────────
+    def close(self) -> None:
+        self._closed = True
+        for _ in range(self.workers):
+            try:
+                self._jobs.put(None, timeout=1)
+            except queue.Full:
+                break
+        for process in self._processes:
+            if process is not None and process.poll() is None:
+                process.terminate()
+
+    def memory_bytes(self) -> int:
+        """Resident memory of the worker processes, where each copy of the model lives."""
+        return sum(rss_bytes(p.pid) or 0 for p in self._processes if p is not None and p.poll() is None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "alive": sum(self._alive),
+                "queue_depth": self._jobs.qsize(),
+                "queue_capacity": self._jobs.maxsize,
+                "in_flight": self.in_flight,
+                "completed": self.completed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+                "restarts": self.restarts,
+                "wait_ms": _percentiles(self._wait_times),
+                "service_ms": _percentiles(self._service_times),
+            }
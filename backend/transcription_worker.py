@@ -0,0 +1,47 @@
+# transcription_worker.py
+# Worker process for TranscriptionPool
+
+"""
+Loads one transcription backend, then serves jobs: reads pickled
+(audio, language) tuples from stdin and writes pickled ("ok", result) or
+("error", message) replies to stdout. The first reply is ("ready", name) once
+the model is loaded, or ("error", message) if it can't be.
+
+    python transcription_worker.py <backend> <model_size>
+"""
+
+import os
+import pickle
+import sys
+
+def main() -> int:
+    backend_name, model_size = sys.argv[1], sys.argv[2]
+    jobs = sys.stdin.buffer
+    replies = os.fdopen(os.dup(sys.stdout.fileno()), "wb")
+    # Progress bars and prints from model libraries must not corrupt the reply stream
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+
+    def reply(message) -> None:
+        pickle.dump(message, replies, protocol=pickle.HIGHEST_PROTOCOL)
+        replies.flush()
+
+    try:
+        from transcription import load_backend
+        backend = load_backend(backend_name, model_size=model_size)
+    except Exception as e:
+        reply(("error", f"{type(e).__name__}: {e}"))
+        return 1
+    reply(("ready", backend.name))
+
+    while True:
+        try:
+            audio, language = pickle.load(jobs)
+        except EOFError:
+            return 0
+        try:
+            reply(("ok", backend.transcribe(audio, language=language)))
+        except Exception as e:
+            reply(("error", f"{type(e).__name__}: {e}"))
+
+if __name__ == "__main__":
+    sys.exit(main())
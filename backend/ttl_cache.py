@@ -0,0 +1,113 @@
+# ttl_cache.py
+# Thread-safe bounded LRU cache with per-entry expiry and optional on-disk persistence
+
+from collections import OrderedDict
+import json
+import os
+import threading
+import time
+from typing import Any, Optional, Tuple
+
+class TTLCache:
+    """
+    LRU cache of JSON-serializable values.
+
+    Entries expire `ttl` seconds after they were stored (0 keeps them until
+    evicted). Once `capacity` entries are held the least recently used one is
+    evicted. With `path` set, `save()` writes the live entries atomically and a
+    new cache reloads them, so results survive restarts.
+    """
+
+    def __init__(self, capacity: int, ttl: float = 0, path: Optional[str] = None):
+        self.capacity = max(0, capacity)
+        self.ttl = ttl
+        self.path = path
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        if path:
+            self._load()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at and expires_at <= time.time():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: str, value: Any) -> None:
+        if not self.capacity:
+            return
+        expires_at = time.time() + self.ttl if self.ttl else 0
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "capacity": self.capacity,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+    # ── Persistence ──────────────────────────────────
+    def _load(self) -> None:
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r") as f:
+                entries = json.load(f)
+        except Exception as e:
+            print(f"[TTLCache] Error loading {self.path}: {e}")
+            return
+        now = time.time()
+        # Saved least recently used first, so replaying restores the LRU order
+        for key, expires_at, value in entries[-self.capacity:] if self.capacity else []:
+            if not expires_at or expires_at > now:
+                self._entries[key] = (expires_at, value)
+
+    def save(self) -> None:
+        if not self.path:
+            return
+        now = time.time()
+        with self._lock:
+            entries = [[key, expires_at, value] for key, (expires_at, value) in self._entries.items()
+                       if not expires_at or expires_at > now]
+        tmp_path = self.path + ".tmp"
+        try:
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            with open(tmp_path, "w") as f:
+                json.dump(entries, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            print(f"[TTLCache] Error saving {self.path}: {e}")
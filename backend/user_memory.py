@@ -0,0 +1,176 @@
+# user_memory.py
+# Per-user memory shards and an LRU of the users currently resident in the process
+
+from collections import OrderedDict
+import hashlib
+import os
+import re
+import threading
+from typing import Callable, Dict, Generic, List, Optional, TypeVar
+
+from config import config
+
+T = TypeVar("T")
+
+def shard_path(user_id: str, base_dir: Optional[str] = None, extension: str = ".json") -> str:
+    """Return the memory file for one user, e.g. ren_users/ada-1f3870be.json."""
+    base_dir = base_dir or config.MEMORY_USER_DIR
+    os.makedirs(base_dir, exist_ok=True)
+    safe = re.sub(r"[^A-Za-z0-9_.-]", "_", user_id)[:48] or "user"
+    # The digest keeps ids that sanitize to the same name from sharing a shard
+    digest = hashlib.sha1(user_id.encode("utf-8")).hexdigest()[:8]
+    return os.path.join(base_dir, f"{safe}-{digest}{extension}")
+
+class _Slot(Generic[T]):
+    """
+    A resident user: its object once `loaded` is set, or the error that
+    stopped it loading, and how many callers are currently using it.
+    """
+
+    __slots__ = ("value", "error", "loaded", "leases", "evicted")
+
+    def __init__(self):
+        self.value: Optional[T] = None
+        self.error: Optional[BaseException] = None
+        self.loaded = threading.Event()
+        self.leases = 1  # held by the caller that builds it
+        self.evicted = False
+
+class ResidentUsers(Generic[T]):
+    """
+    Thread-safe LRU of per-user objects (agents, memory stores, ...).
+
+    `factory(user_id)` loads a cold user on demand; once more than `capacity`
+    users are resident the least recently used one is dropped and handed to
+    `on_evict` so it can flush and release its resources.
+
+    The factory runs outside the lock: a placeholder slot is inserted first,
+    so concurrent requests for the same user wait for that one load while
+    requests for other users carry on.
+
+    `acquire` leases a user until the matching `release`. A leased user that
+    falls out of the LRU keeps draining until its last lease is released and
+    only then goes to `on_evict`; if it is asked for again meanwhile, the
+    same object is brought back rather than a second one loaded.
+    """
+
+    def __init__(self, factory: Callable[[str], T], capacity: Optional[int] = None,
+                 on_evict: Optional[Callable[[T], None]] = None):
+        self.factory = factory
+        self.capacity = max(1, capacity or config.MEMORY_RESIDENT_USERS)
+        self.on_evict = on_evict
+        self._entries: "OrderedDict[str, _Slot[T]]" = OrderedDict()
+        self._draining: Dict[str, "_Slot[T]"] = {}  # evicted, waiting for their leases
+        self._lock = threading.Lock()
+        self.loads = 0
+        self.evictions = 0
+
+    def get(self, user_id: str) -> T:
+        """Return the user's object without leasing it; it may be released at any time."""
+        value = self.acquire(user_id)
+        self.release(user_id)
+        return value
+
+    def acquire(self, user_id: str) -> T:
+        """Return the user's object, kept alive until `release(user_id)`."""
+        with self._lock:
+            slot = self._entries.get(user_id) or self._draining.pop(user_id, None)
+            building = slot is None
+            if building:
+                slot = _Slot()
+                self.loads += 1
+            else:
+                slot.leases += 1
+                slot.evicted = False
+            self._entries[user_id] = slot
+            self._entries.move_to_end(user_id)
+            free = self._trim()
+
+        try:
+            if building:
+                try:
+                    slot.value = self.factory(user_id)
+                except BaseException as e:
+                    slot.error = e
+                    with self._lock:
+                        if self._entries.get(user_id) is slot:
+                            del self._entries[user_id]
+                        elif self._draining.get(user_id) is slot:
+                            del self._draining[user_id]
+                    raise
+                finally:
+                    slot.loaded.set()
+            else:
+                slot.loaded.wait()
+                if slot.error is not None:
+                    raise RuntimeError(f"Could not load user {user_id!r}: {slot.error}")
+        finally:
+            for old in free:
+                self._release(old)
+        return slot.value
+
+    def release(self, user_id: str) -> None:
+        """Drop one lease; an evicted user is handed to `on_evict` when its last lease goes."""
+        with self._lock:
+            slot = self._entries.get(user_id) or self._draining.get(user_id)
+            if slot is None or slot.leases == 0:
+                return
+            slot.leases -= 1
+            done = slot.evicted and slot.leases == 0
+            if done:
+                del self._draining[user_id]
+        if done:
+            self._release(slot)
+
+    def _trim(self) -> List["_Slot[T]"]:
+        # Caller holds the lock; returns the evicted slots that are free to release now
+        free = []
+        while len(self._entries) > self.capacity:
+            user_id, slot = self._entries.popitem(last=False)
+            self.evictions += 1
+            free.extend(self._retire(user_id, slot))
+        return free
+
+    def _retire(self, user_id: str, slot: "_Slot[T]") -> List["_Slot[T]"]:
+        slot.evicted = True
+        if slot.leases:
+            self._draining[user_id] = slot
+            return []
+        return [slot]
+
+    def evict(self, user_id: str) -> bool:
+        with self._lock:
+            slot = self._entries.pop(user_id, None)
+            if slot is None:
+                return False
+            self.evictions += 1
+            free = self._retire(user_id, slot)
+        for slot in free:
+            self._release(slot)
+        return True
+
+    def _release(self, slot: "_Slot[T]") -> None:
+        if self.on_evict and slot.error is None:
+            try:
+                self.on_evict(slot.value)
+            except Exception as e:
+                print(f"[ResidentUsers] Error releasing user: {e}")
+
+    def resident_users(self) -> List[str]:
+        with self._lock:
+            return list(self._entries)
+
+    def close(self) -> None:
+        """Evict every user; ones still leased are released when their requests finish."""
+        with self._lock:
+            free = []
+            while self._entries:
+                free.extend(self._retire(*self._entries.popitem(last=False)))
+        for slot in free:
+            self._release(slot)
+
+    def stats(self) -> dict:
+        with self._lock:
+            resident, draining = len(self._entries), len(self._draining)
+        return {"resident": resident, "draining": draining, "capacity": self.capacity,
+                "loads": self.loads, "evictions": self.evictions}
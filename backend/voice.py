@@ -1,8 +1,9 @@
 # ----------- ren/voice.py -----------
-from io import BytesIO
+from collections import deque
 import logging
-import os
-import tempfile
+import queue
+import time
+from typing import BinaryIO, Deque, Iterator, Optional, Tuple
 
 from click import style
 import numpy as np
@@ -11,8 +12,14 @@ from pydub.playback import play
 import requests
 import sounddevice as sd
 
+from audio_cache import AudioCache, speech_key
+from audio_decode import AudioTooLong, decode_audio, read_limited
 from config import config
-from speech_recognition import model as whisper_model
+from long_audio import transcribe_long
+from model_loader import ModelNotReady, models
+import speech_recognition  # registers the Whisper model with the loader
+from transcription import SAMPLE_RATE
+from voice_activity import Endpointer, webrtcvad
 
 # Initialize logging
 logging.basicConfig(level=logging.INFO)
@@ -28,25 +35,55 @@ TONE_TO_STYLE = {
     "sharp": "assertive"
 }
 
+VOICE_SETTINGS = {"stability": 0.4, "similarity_boost": 0.75}
 
-# Global whisper model instance (lazy loading)
-_whisper_model = None
+# Synthesized clips, reused for repeated replies (TTS_CACHE_MAX_MB=0 disables it)
+tts_cache = AudioCache(config.TTS_CACHE_DIR, int(config.TTS_CACHE_MAX_MB * 1024 * 1024))
 
 def get_whisper_model():
-    """Get or initialize the Whisper model (lazy loading)."""
-    global _whisper_model
-    if _whisper_model is None:
-        try:
-            logger.info(f"Loading Whisper model: {config.WHISPER_MODEL}")
-            _whisper_model = whisper_model
-        except Exception as e:
-            logger.error(f"Failed to load Whisper model: {e}")
-            raise RuntimeError(f"Could not initialize Whisper model: {e}")
-    return _whisper_model
+    """Get the Whisper model, raising ModelNotReady while it is still loading."""
+    return models.get("whisper")
+
+def transcription_pool_stats() -> Optional[dict]:
+    """Queue depth, wait and service times of the transcription worker pool, once it is running."""
+    model = models.peek("whisper")  # a health check isn't a use; don't keep the model from going idle
+    return model.stats() if hasattr(model, "stats") else None
+
+# Seconds from the end of speech to a finished transcript, for the last utterances
+endpoint_latencies: Deque[float] = deque(maxlen=100)
+
+def endpoint_latency_stats() -> dict:
+    latencies = sorted(endpoint_latencies)
+    if not latencies:
+        return {"utterances": 0, "median_seconds": None}
+    return {"utterances": len(latencies), "median_seconds": round(latencies[len(latencies) // 2], 3)}
+
+def record_utterance(fs: int) -> Endpointer:
+    """Record from the microphone until the VAD hears the end of the utterance (or the time cap)."""
+    endpointer = Endpointer(sample_rate=fs)
+    frames: "queue.Queue[np.ndarray]" = queue.Queue()
+
+    def callback(indata, frame_count, time_info, status):
+        frames.put(indata[:, 0].copy())
+
+    with sd.InputStream(samplerate=fs, channels=1, dtype="float32", blocksize=endpointer.frame_samples,
+                        callback=callback):
+        while True:
+            try:
+                frame = frames.get(timeout=1)
+            except queue.Empty:
+                raise RuntimeError("No audio received from the microphone")
+            if endpointer.feed(frame):
+                return endpointer
 
 def listen_to_voice():
     """
     Record audio from microphone and transcribe using Whisper.
+
+    With webrtcvad installed (and VAD_ENABLED) recording stops once the
+    speaker has been silent for VAD_SILENCE_MS, capped at VAD_MAX_SECONDS,
+    and only the speech frames are transcribed; otherwise it records a fixed
+    AUDIO_DURATION seconds.
     
     Returns:
         str: Transcribed text from audio
@@ -54,25 +91,31 @@ def listen_to_voice():
     Raises:
         RuntimeError: If audio recording or transcription fails
     """
+    model = models.acquire("whisper")  # fail fast instead of recording for nothing
     try:
         fs = config.AUDIO_SAMPLE_RATE
-        seconds = config.AUDIO_DURATION
-        
+        endpointer = None
+
         logger.info("🎙️ Listening...")
         print("🎙️ Listening...")
-        
-        # Record audio
-        recording = sd.rec(int(seconds * fs), samplerate=fs, channels=1, dtype=np.float32)
-        sd.wait()
-        
-        if recording is None or len(recording) == 0:
-            raise RuntimeError("Failed to record audio")
-        
-        # Process audio
-        audio = np.squeeze(recording)
+
+        if config.VAD_ENABLED and webrtcvad is not None:
+            endpointer = record_utterance(fs)
+            audio = endpointer.speech_audio()
+            if len(audio) == 0:
+                raise RuntimeError("No speech detected")
+        else:
+            # Record audio
+            recording = sd.rec(int(config.AUDIO_DURATION * fs), samplerate=fs, channels=1, dtype=np.float32)
+            sd.wait()
+
+            if recording is None or len(recording) == 0:
+                raise RuntimeError("Failed to record audio")
+
+            # Process audio
+            audio = np.squeeze(recording)
         
         # Transcribe using Whisper
-        model = get_whisper_model()
         result = model.transcribe(audio)
         
         if not result or 'text' not in result:
@@ -83,6 +126,8 @@ def listen_to_voice():
             raise RuntimeError("Transcription result is not a valid string")
 
         transcribed_text = result["text"].strip()
+        if endpointer is not None and endpointer.speech_ended_at is not None:
+            endpoint_latencies.append(time.time() - endpointer.speech_ended_at)
         logger.info(f"📝 Transcribed: {transcribed_text}")
         print(f"📝 You said: {transcribed_text}")
 
@@ -90,30 +135,53 @@ def listen_to_voice():
             raise RuntimeError("No speech detected")
         
         return transcribed_text
-        
+
+    except ModelNotReady:
+        raise
     except Exception as e:
         logger.error(f"Voice listening failed: {e}")
         raise RuntimeError(f"Voice listening failed: {e}")
+    finally:
+        models.release("whisper")
     
-def transcribe_audio_file(file_stream: BytesIO) -> str:
+def transcribe_audio_file(file_stream: BinaryIO, content_type: Optional[str] = None) -> str:
     """
-    Transcribe uploaded audio using Whisper (requires writing to temp file).
+    Transcribe uploaded audio using Whisper, decoding it in memory (no temp file).
 
     Args:
-        file_stream (BytesIO): Incoming audio stream
+        file_stream (BinaryIO): Incoming audio stream, read up to config.TRANSCRIBE_MAX_BYTES
+        content_type (str): The upload's MIME type; needed for raw PCM bodies
 
     Returns:
         str: Transcribed text
+
+    Raises:
+        ValueError: If the audio is too large, too long or can't be decoded
     """
-    try:
-        model = get_whisper_model()
+    return transcribe_upload(file_stream, content_type=content_type)["text"]
 
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".mp3") as tmp:
-            tmp.write(file_stream.read())
-            tmp_path = tmp.name
+def transcribe_upload(file_stream: BinaryIO, content_type: Optional[str] = None) -> dict:
+    """
+    Like transcribe_audio_file, but returns the whole result: text, timestamped
+    segments and language. Recordings longer than config.TRANSCRIBE_LONG_SECONDS
+    are split at pauses and the pieces transcribed in parallel (see long_audio).
 
-        result = model.transcribe(tmp_path)
-        os.remove(tmp_path)  # Clean up the temp file
+    config.TRANSCRIBE_MAX_SECONDS only limits recordings transcribed in one
+    pass; split ones may run up to config.TRANSCRIBE_LONG_MAX_SECONDS.
+    """
+    # Leased so the model isn't unloaded between the chunks of a long recording
+    model = models.acquire("whisper")
+    try:
+        chunking = config.TRANSCRIBE_LONG_SECONDS > 0
+        max_seconds = max(config.TRANSCRIBE_MAX_SECONDS, config.TRANSCRIBE_LONG_MAX_SECONDS) if chunking else None
+        audio = decode_audio(read_limited(file_stream), content_type=content_type, max_seconds=max_seconds)
+        seconds = len(audio) / SAMPLE_RATE
+        if chunking and seconds > config.TRANSCRIBE_LONG_SECONDS:
+            result = transcribe_long(model, audio)
+        elif seconds > config.TRANSCRIBE_MAX_SECONDS:
+            raise AudioTooLong(f"Audio is {seconds:.1f}s long; the limit is {config.TRANSCRIBE_MAX_SECONDS:g}s")
+        else:
+            result = model.transcribe(audio)
 
         if not result or 'text' not in result:
             raise RuntimeError("Transcription failed or no text returned")
@@ -124,10 +192,14 @@ def transcribe_audio_file(file_stream: BytesIO) -> str:
         elif not isinstance(text, str):
             raise RuntimeError("Transcription text is not a valid string or list")
 
-        return text.strip()
+        return {**result, "text": text.strip()}
+    except (ModelNotReady, ValueError):
+        raise
     except Exception as e:
         logger.error(f"Transcription failed: {e}")
         raise RuntimeError(f"Transcription failed: {e}")
+    finally:
+        models.release("whisper")
 
 
 def speak(text: str, tone: str = "calm") -> bytes:
@@ -143,16 +215,39 @@ def speak(text: str, tone: str = "calm") -> bytes:
     Raises:
         RuntimeError: On API or conversion error
     """
+    return synthesize(text, tone)[0]
+
+def _cache_speech(key: str, audio: bytes) -> None:
+    # The clip has already been paid for; a full or read-only cache disk mustn't fail the reply
+    try:
+        tts_cache.put(key, audio)
+    except OSError as e:
+        logger.warning(f"Could not cache synthesized speech: {e}")
+
+def synthesize(text: str, tone: str = "calm") -> Tuple[bytes, bool]:
+    """
+    Like speak(), but also says whether the audio came from the TTS cache.
+
+    Fixed replies repeat a lot, so clips are cached on disk by a hash of the
+    text, voice, style and voice settings (see audio_cache); a repeat costs a
+    file read instead of an API call.
+    """
     if not text or not text.strip():
         logger.warning("Empty text provided to speak function")
-        return b""
+        return b"", False
 
     text = text.strip()
     logger.info(f"Ren: {text}")
 
     if not config.is_voice_enabled():
         logger.warning("Voice not configured, skipping TTS")
-        return b""
+        return b"", False
+
+    style = TONE_TO_STYLE.get(tone, "conversational")
+    key = speech_key(text, config.ELEVEN_VOICE_ID, style, VOICE_SETTINGS)
+    cached = tts_cache.get(key)
+    if cached is not None:
+        return cached, True
 
     try:
         url = f"https://api.elevenlabs.io/v1/text-to-speech/{config.ELEVEN_VOICE_ID}"
@@ -160,12 +255,10 @@ def speak(text: str, tone: str = "calm") -> bytes:
             "xi-api-key": config.ELEVENLABS_API_KEY,
             "Content-Type": "application/json",
         }
-        
-        style = TONE_TO_STYLE.get(tone, "conversational")
-        
+
         payload = {
             "text": text,
-            "voice_settings": {"stability": 0.4, "similarity_boost": 0.75, "style": style}
+            "voice_settings": {**VOICE_SETTINGS, "style": style}
         }
 
         logger.info("Calling ElevenLabs TTS API...")
@@ -174,11 +267,69 @@ def speak(text: str, tone: str = "calm") -> bytes:
         if response.status_code != 200:
             raise RuntimeError(f"ElevenLabs API error: {response.status_code} - {response.text}")
 
-        return response.content
+        _cache_speech(key, response.content)
+        return response.content, False
 
     except requests.exceptions.RequestException as e:
         logger.error(f"Network error during TTS: {e}")
         raise RuntimeError(f"Network error during text-to-speech: {e}")
     except Exception as e:
         logger.error(f"TTS failed: {e}")
-        raise RuntimeError(f"Text-to-speech failed: {e}")
\ No newline at end of file
+        raise RuntimeError(f"Text-to-speech failed: {e}")
+
+def synthesize_stream(text: str, tone: str = "calm") -> Tuple[Iterator[bytes], bool]:
+    """
+    Streaming variant of synthesize(): returns an iterator of MP3 chunks and
+    whether they come from the cache.
+
+    Uses ElevenLabs' /stream endpoint with `stream=True`, so the first chunks
+    can be relayed while the rest of the reply is still being synthesized.
+    The request is made (and its status checked) before returning, so API
+    errors still raise here; a fully streamed clip is added to the cache.
+    """
+    if not text or not text.strip() or not config.is_voice_enabled():
+        return iter([synthesize(text, tone)[0]]), False
+
+    text = text.strip()
+    style = TONE_TO_STYLE.get(tone, "conversational")
+    key = speech_key(text, config.ELEVEN_VOICE_ID, style, VOICE_SETTINGS)
+    cached = tts_cache.get(key)
+    if cached is not None:
+        return iter([cached]), True
+
+    try:
+        url = f"https://api.elevenlabs.io/v1/text-to-speech/{config.ELEVEN_VOICE_ID}/stream"
+        headers = {
+            "xi-api-key": config.ELEVENLABS_API_KEY,
+            "Content-Type": "application/json",
+        }
+        payload = {
+            "text": text,
+            "voice_settings": {**VOICE_SETTINGS, "style": style}
+        }
+
+        logger.info("Calling ElevenLabs streaming TTS API...")
+        response = requests.post(url, json=payload, headers=headers, timeout=30, stream=True)
+        if response.status_code != 200:
+            message = response.text
+            response.close()
+            raise RuntimeError(f"ElevenLabs API error: {response.status_code} - {message}")
+    except requests.exceptions.RequestException as e:
+        logger.error(f"Network error during TTS: {e}")
+        raise RuntimeError(f"Network error during text-to-speech: {e}")
+
+    def relay() -> Iterator[bytes]:
+        chunks = []
+        try:
+            for chunk in response.iter_content(chunk_size=config.TTS_STREAM_CHUNK_BYTES):
+                if chunk:
+                    chunks.append(chunk)
+                    yield chunk
+        except requests.exceptions.RequestException as e:
+            logger.error(f"TTS stream interrupted: {e}")
+            return  # the client gets a truncated clip; don't cache it
+        finally:
+            response.close()
+        _cache_speech(key, b"".join(chunks))
+
+    return relay(), False
@@ -0,0 +1,83 @@
+# voice_activity.py
+# webrtcvad endpointing: decides when an utterance has ended and keeps only its speech frames
+
+from collections import deque
+import time
+from typing import Callable, Deque, List, Optional
+
+import numpy as np
+
+from config import config
+
+try:
+    import webrtcvad
+except ImportError:  # optional: listen_to_voice falls back to fixed-length recording
+    webrtcvad = None
+
+class Endpointer:
+    """
+    Feed fixed-size float32 frames with `feed()`; it returns True once the
+    utterance is over: `silence_ms` of non-speech after speech, or
+    `max_seconds` of audio in total.
+
+    Leading silence is dropped except for a short pre-roll so the first word
+    isn't clipped, and pauses inside the utterance are trimmed to `pause_ms`,
+    so `speech_audio()` is essentially just the speech.
+    """
+
+    def __init__(self, sample_rate: int = 16000, frame_ms: Optional[int] = None,
+                 aggressiveness: Optional[int] = None, silence_ms: Optional[int] = None,
+                 max_seconds: Optional[float] = None, pre_roll_ms: int = 300, pause_ms: int = 300,
+                 is_speech: Optional[Callable[[bytes, int], bool]] = None):
+        self.sample_rate = sample_rate
+        self.frame_ms = frame_ms or config.VAD_FRAME_MS
+        if self.frame_ms not in (10, 20, 30):
+            raise ValueError("webrtcvad frames must be 10, 20 or 30 ms")
+        self.frame_samples = sample_rate * self.frame_ms // 1000
+        if is_speech is None:
+            if webrtcvad is None:
+                raise RuntimeError("webrtcvad is not installed")
+            is_speech = webrtcvad.Vad(config.VAD_AGGRESSIVENESS if aggressiveness is None else aggressiveness).is_speech
+        self._is_speech = is_speech
+        self.silence_frames = (silence_ms or config.VAD_SILENCE_MS) // self.frame_ms
+        self.max_frames = int((max_seconds or config.VAD_MAX_SECONDS) * 1000 / self.frame_ms)
+        self.pause_frames = pause_ms // self.frame_ms
+
+        self._pre_roll: Deque[np.ndarray] = deque(maxlen=max(1, pre_roll_ms // self.frame_ms))
+        self._speech: List[np.ndarray] = []
+        self._silence: List[np.ndarray] = []  # non-speech frames since the last speech frame
+        self.frames_seen = 0
+        self.triggered = False
+        self.speech_ended_at: Optional[float] = None  # wall time of the last speech frame
+
+    def feed(self, frame: np.ndarray) -> bool:
+        frame = np.asarray(frame, dtype=np.float32).reshape(-1)
+        if len(frame) != self.frame_samples:
+            raise ValueError(f"Expected {self.frame_samples}-sample frames, got {len(frame)}")
+        self.frames_seen += 1
+        pcm = (np.clip(frame, -1.0, 1.0) * 32767).astype("<i2").tobytes()
+        speech = self._is_speech(pcm, self.sample_rate)
+
+        if speech:
+            if not self.triggered:
+                self.triggered = True
+                self._speech.extend(self._pre_roll)
+            # Keep a short pause between words, drop the rest of a long one
+            self._speech.extend(self._silence[:self.pause_frames])
+            self._silence.clear()
+            self._speech.append(frame)
+            self.speech_ended_at = time.time()
+        elif self.triggered:
+            self._silence.append(frame)
+        else:
+            self._pre_roll.append(frame)
+
+        if self.triggered and len(self._silence) >= self.silence_frames:
+            return True
+        return self.frames_seen >= self.max_frames
+
+    def speech_audio(self) -> np.ndarray:
+        """The utterance's speech (with a little trailing padding); empty if nothing was said."""
+        if not self._speech:
+            return np.zeros(0, dtype=np.float32)
+        return np.concatenate(self._speech + self._silence[:self.pause_frames])